@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
 
+import sys
+import heapq
+from array import array
+import numpy as np
+
 def main():
-    for i in range(int(input())):
-        N, K = map(int, input().split())
-        assert N <= 1000 and N % K == 0
-        names = [ input() for _ in range(N) ]
-        ans = process_case(names, K)
+    use_trie = '--trie' in sys.argv[1:]
+    # in trie mode names are read as bytes, so read everything that way
+    readline = sys.stdin.buffer.readline if use_trie else input
+    for i in range(int(readline())):
+        N, K = map(int, readline().split())
+        assert N % K == 0
+        if use_trie:
+            ans = process_case_trie(read_names(N), K)
+        else:
+            names = [ input() for _ in range(N) ]
+            ans = process_case(names, K)
         print(f'Case #{i+1}: {ans}')
 
+def read_names(N: int) -> tuple[np.ndarray, np.ndarray]:
+    '''read N names from stdin into a zero-padded byte matrix (and their lengths)'''
+    data, lengths = bytearray(), array('q')
+    for _ in range(N):
+        name = sys.stdin.buffer.readline().rstrip(b'\n')
+        data += name
+        lengths.append(len(name))
+    lengths = np.frombuffer(lengths, dtype=np.int64)
+    matrix = np.zeros((N, max(int(lengths.max(initial=0)), 1)), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(N), lengths)
+    matrix[rows, np.arange(len(rows)) - starts[rows]] = np.frombuffer(data, dtype=np.uint8)
+    return matrix, lengths
+
 # - The longest common prefix of a set of names is equivalent to the longest
 #   common prefix between min(names) and max(names), or put another way, the
 #   names with minimum and maximum index in a sorted list.
@@ -23,24 +48,142 @@ def main():
 #   maximum score of groups left).
 # - We can find a maximum-score group by checking all K contiguous segments
 #   of the list. Iteratively remove these groups until left with no names.
-# - It could be further optimized by using a tree data structure that computes
-#   LCA in constant time, or to incrementally recompute the subscores only at
-#   the position we removed the word...
+# - To make it fast, we compute the common prefix of every adjacent pair once;
+#   the common prefix of any two names is then the minimum over the pairs
+#   between them (range minimum query, with a sparse table). Names left are
+#   kept in a linked list and window scores in a heap, and after removing a
+#   group we only recompute the (less than K) windows that spanned it.
 
-def common_prefix(a, b):
-    for x, y in zip(a, b):
-        if x != y: break
-        yield x
+def common_prefix(a: str, b: str) -> int:
+    # binary search, so comparisons happen in C land
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def build_sparse_table(values: np.ndarray) -> list[np.ndarray]:
+    # level k holds the minimum of every range of length 2**k
+    table = [ values ]
+    while 2 * len(table[-1]) > len(values) + 1 and len(table[-1]) > 1:
+        prev, half = table[-1], 1 << (len(table) - 1)
+        table.append(np.minimum(prev[:-half], prev[half:]))
+    return table
 
 def process_case(names: list[str], K: int) -> int:
     names = sorted(names)
+    N = len(names)
+    lcps = np.array([ common_prefix(names[i], names[i+1]) for i in range(N - 1) ], dtype=np.int64)
+    table = build_sparse_table(lcps) if N > 1 else []
+
+    def get_score(a: int, b: int) -> int:
+        # common prefix of names[a] and names[b], a <= b
+        if a == b: return len(names[a])
+        level = (b - a).bit_length() - 1
+        return int(min(table[level][a], table[level][b - (1 << level)]))
+
+    # linked list of names left (N is the end sentinel)
+    next_ = list(range(1, N + 1))
+    prev = list(range(-1, N - 1))
+    alive = [True] * N
+    def window(start: int) -> list[int]:
+        # up to K names starting at `start`
+        out = []
+        while start < N and len(out) < K:
+            out.append(start)
+            start = next_[start]
+        return out
+
+    # heap of (-score, -start); entries are stale if the start was
+    # removed or its window changed since they were pushed
+    scores: dict[int, int] = {}
+    heap = []
+    def update_windows(starts: list[int]):
+        for a, b in zip(starts, starts[K-1:]):
+            scores[a] = score = get_score(a, b)
+            heapq.heappush(heap, (-score, -a))
+
+    update_windows(list(range(N)))
     score = 0
-    get_score = lambda a, b: sum(1 for _ in common_prefix(a, b))
-    while names:
-        subscore, pos = max((get_score(names[i], names[i+K-1]), i)
-            for i in range(len(names) - (K-1)))
+    for _ in range(N // K):
+        while True:
+            subscore, pos = heapq.heappop(heap)
+            subscore, pos = -subscore, -pos
+            if alive[pos] and scores.get(pos) == subscore:
+                break
         score += subscore
-        names = names[:pos] + names[pos + K:]
+
+        # remove the window from the linked list
+        group = window(pos)
+        for x in group:
+            alive[x] = False
+            scores.pop(x, None)
+        before, after = prev[group[0]], next_[group[-1]]
+        if before >= 0: next_[before] = after
+        if after < N: prev[after] = before
+
+        # recompute windows that started before the group
+        starts = []
+        while before >= 0 and len(starts) < K - 1:
+            starts.append(before)
+            before = prev[before]
+        starts.reverse()
+        if starts:
+            spanned = starts + window(after)[:K-1]
+            for x in starts[max(len(spanned) - K + 1, 0):]:
+                scores.pop(x, None)  # no longer K names after it
+            update_windows(spanned)
     return score
 
+# For huge lists there's an alternative: the score of the greedy equals
+# the sum of floor(count / K) over every trie node but the root, count
+# being the names under it. We build a compressed trie from the sorted
+# names (its nodes are the intervals of the adjacent common prefix
+# array) into flat arrays, and sum that bottom-up.
+
+LCP_CHUNK = 1 << 16  # names compared at once, bounds memory use
+
+def adjacent_common_prefixes(matrix: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    out = np.zeros(max(len(matrix) - 1, 0), dtype=np.int64)
+    for start in range(0, len(out), LCP_CHUNK):
+        end = min(start + LCP_CHUNK, len(out))
+        differ = matrix[start+1:end+1] != matrix[start:end]
+        first = np.where(differ.any(axis=1), differ.argmax(axis=1), matrix.shape[1])
+        out[start:end] = np.minimum(first, np.minimum(lengths[start+1:end+1], lengths[start:end]))
+    return out
+
+def build_trie(lcps: np.ndarray, N: int) -> tuple[array, array, array]:
+    '''build the internal nodes of a compressed trie over N sorted names'''
+    # nodes are (depth, count, parent) in flat arrays, node 0 is the root.
+    # the stack holds (depth, first name, node) of the nodes being built
+    depths, counts, parents = array('q', [0]), array('q', [N]), array('q', [-1])
+    stack = [ (0, 0, 0) ]
+    for i, h in enumerate(lcps.tolist() + [0], start=1):
+        first = i - 1
+        while h < stack[-1][0]:
+            _, first, node = stack.pop()
+            counts[node] = i - first
+            parents[node] = stack[-1][2] if h <= stack[-1][0] else len(depths)
+        if h > stack[-1][0]:
+            stack.append((h, first, len(depths)))
+            depths.append(h); counts.append(0); parents.append(stack[-2][2])
+    return depths, counts, parents
+
+def process_case_trie(names: tuple[np.ndarray, np.ndarray], K: int) -> int:
+    matrix, lengths = names
+    order = np.argsort(matrix.view(f'S{matrix.shape[1]}').ravel())
+    matrix, lengths = matrix[order], lengths[order]
+    lcps = adjacent_common_prefixes(matrix, lengths)
+
+    depths, counts, parents = (np.frombuffer(x, dtype=np.int64) for x in build_trie(lcps, len(lengths)))
+    edges = depths[1:] - depths[parents[1:]]
+    score = int((edges * (counts[1:] // K)).sum())
+
+    # leaves (one per name) hang from the deepest node they share
+    neighbors = np.maximum(np.append(lcps, 0), np.insert(lcps, 0, 0))
+    return score + int((lengths - neighbors).sum()) * (1 // K)
+
 if __name__ == '__main__': main()
@@ -1,20 +1,26 @@
 #!/usr/bin/env python3
 
-from itertools import groupby
+import os
+import sys
+import math
+from typing import Optional
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # Note: the 0 <= D <= 20 limit is incorrect
 
-sorted_groupby = lambda x, k: groupby(sorted(x, key=k), key=k)
-dict_groupby = lambda x, fk, fv: \
-    { k: list(map(fv, vs)) for k, vs in sorted_groupby(x, fk) }
-
 def main():
     for i in range(int(input())):
         M = int(input())
         assert 1 <= M <= 100
         websites = [ parse_website() for _ in range(M) ]
-        ans = process_case(websites)
+        if '--all-currencies' in sys.argv[1:]:
+            # answer the round trip for every currency, not only BTC
+            profits = process_case_all(websites, parallel='--parallel' in sys.argv[1:])
+            ans = ','.join(f'{c}={profit}' for c, profit in sorted(profits.items()))
+        else:
+            ans = process_case(websites)
         print(f'Case #{i+1}: {ans}')
 
 Trade = tuple[str, str, int]
@@ -49,11 +55,15 @@ def parse_trade() -> Trade:
 
 def process_case(websites: list[Website]) -> int:
     # make digraph (remove D=0 edges) and derive our duplicated graph
-    graph = preprocess_graph(websites)
-    start, end = (False, 'BTC'), (True, 'BTC')
+    currencies, graph, rgraph = preprocess_graph(websites)
+    if 'BTC' not in currencies: return 1
+    return best_profit(graph, rgraph, currencies['BTC'])
+
+def best_profit(graph: 'CSRDigraph', rgraph: 'CSRDigraph', currency: int) -> int:
+    start, end = 2 * currency, 2 * currency + 1
 
     # BFS to find shortest paths
-    predecessors = find_predecessors(graph, start, end)
+    predecessors = find_predecessors(graph, rgraph, start, end)
     if predecessors is None: return 1
 
     # from all shortest paths, find the one with maximum profit
@@ -61,56 +71,151 @@ def process_case(websites: list[Website]) -> int:
     # want to find longest path)
     return dag_longest_path(predecessors, end, start)
 
-# bool is True if we've already profitable, i.e. destination copy
-Node = tuple[bool, str]
+def process_case_all(websites: list[Website], parallel=False) -> dict[str, int]:
+    '''best profit of the round trip starting at every currency'''
+    # the graph is built once and shared by all the searches
+    currencies, graph, rgraph = preprocess_graph(websites)
+    if not parallel or len(currencies) < 2:
+        return { c: best_profit(graph, rgraph, k) for c, k in currencies.items() }
+    with ProcessPoolExecutor(initializer=set_worker_graph, initargs=(graph, rgraph)) as pool:
+        chunksize = max(1, len(currencies) // (4 * (os.cpu_count() or 1)))
+        profits = pool.map(worker_best_profit, currencies.values(), chunksize=chunksize)
+        return dict(zip(currencies, profits))
+
+# every worker process receives the graph once, at startup
+worker_graph: Optional[tuple['CSRDigraph', 'CSRDigraph']] = None
+def set_worker_graph(graph: 'CSRDigraph', rgraph: 'CSRDigraph'):
+    global worker_graph
+    worker_graph = graph, rgraph
+def worker_best_profit(currency: int) -> int:
+    return best_profit(*worker_graph, currency)
+
+# currencies are interned to ints, and node 2*id + copy is the currency
+# in that copy (1 if we've already profitable, i.e. destination copy)
+Node = int
 Digraph = dict[Node, list[tuple[Node, int]]]
-
-def preprocess_graph(websites: list[Website]) -> Digraph:
+# adjacency in CSR form: edges of node k are [offsets[k], offsets[k+1])
+CSRDigraph = tuple[list[int], list[Node], list[int]]
+
+def make_csr(n: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray) -> CSRDigraph:
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets.tolist(), targets[order].tolist(), weights[order].tolist()
+
+def preprocess_graph(websites: list[Website]) -> tuple[dict[str, int], CSRDigraph, CSRDigraph]:
+    '''returns the interned currencies, the duplicated graph and its reverse'''
+    currencies: dict[str, int] = {}
     edges = ( trade for _, trades in websites for trade in trades )
-    edges = [ (a,b,D) for a,b,D in edges if D > 0 ]
-
-    copied_edges = [ ((copy, a), (copy, b), D)
-        for copy in (False, True) for a, b, D in edges ]
-    copied_edges.extend(
-        ((False, a), (True, b), D) for a, b, D in edges if D > 1 )
-
-    return dict_groupby(copied_edges, lambda edge: edge[0], lambda edge: edge[1:])
-
-def find_predecessors(graph: Digraph, start: Node, end: Node) -> Digraph:
+    edges = np.array([ (currencies.setdefault(a, len(currencies)),
+        currencies.setdefault(b, len(currencies)), D)
+        for a, b, D in edges if D > 0 ], dtype=np.int64).reshape(-1, 3)
+    a, b, D = edges.T
+
+    profitable = D > 1
+    sources = np.concatenate([ 2*a, 2*a + 1, 2*a[profitable] ])
+    targets = np.concatenate([ 2*b, 2*b + 1, 2*b[profitable] + 1 ])
+    weights = np.concatenate([ D, D, D[profitable] ])
+    n = 2 * len(currencies)
+    return currencies, make_csr(n, sources, targets, weights), make_csr(n, targets, sources, weights)
+
+def find_predecessors(graph: CSRDigraph, rgraph: CSRDigraph, start: Node, end: Node) -> Optional[Digraph]:
+    # bidirectional BFS: expand the smallest frontier until they meet
+    distances = [ { start: 0 }, { end: 0 } ]
+    frontiers = [ [start], [end] ]
+    length = None
+    while length is None:
+        if not (frontiers[0] and frontiers[1]):
+            return None  # no shortest path
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        (offsets, targets, _), dist = (graph, rgraph)[side], distances[side]
+        next_frontier = []
+        for a in frontiers[side]:
+            for b in targets[offsets[a]:offsets[a+1]]:
+                if b not in dist:
+                    dist[b] = dist[a] + 1
+                    next_frontier.append(b)
+        frontiers[side] = next_frontier
+        other = distances[1 - side]
+        meet = [ dist[x] + other[x] for x in next_frontier if x in other ]
+        length = min(meet, default=None)
+
+    # every shortest path crosses the last expanded level, where both
+    # distances are known. walk the layers from there to both ends
+    from_start, to_end = distances
+    meeting = { x for x in frontiers[side]
+        if x in from_start and x in to_end and from_start[x] + to_end[x] == length }
+    meeting_level = from_start[next(iter(meeting))]
+    layers = [ set() for _ in range(length + 1) ]
+    layers[meeting_level] = meeting
+    for p in range(meeting_level, 0, -1):
+        offsets, sources, _ = rgraph
+        layers[p-1] = { a for b in layers[p] for a in sources[offsets[b]:offsets[b+1]]
+            if from_start.get(a) == p - 1 }
+    for p in range(meeting_level, length):
+        offsets, targets, _ = graph
+        layers[p+1] = { b for a in layers[p] for b in targets[offsets[a]:offsets[a+1]]
+            if to_end.get(b) == length - p - 1 }
+
+    offsets, targets, weights = graph
     predecessors: Digraph = defaultdict(lambda: [], { start: [] })
-    current_level: set[Node] = set(predecessors)
-
-    while current_level:
-        if end in current_level:
-            return dict(predecessors)
-        next_level: set[Node] = set()
-        for a in current_level:
-            for b, D in graph.get(a, []):
-                if b not in predecessors:
-                    next_level.add(b)
-                if b not in predecessors or b in next_level:
-                    predecessors[b].append((a, D))
-        current_level = next_level
-
-    return None  # no shortest path
+    for layer, next_layer in zip(layers, layers[1:]):
+        for a in layer:
+            for idx in range(offsets[a], offsets[a+1]):
+                if targets[idx] in next_layer:
+                    predecessors[targets[idx]].append((a, weights[idx]))
+    return dict(predecessors)
+
+# profits are products of many D, which grow without bound as exact ints.
+# compare paths by their sum of log(D) instead, and only multiply exactly
+# when two candidates are too close to call (caching the products of
+# visited nodes, so near ties along a long path stay cheap)
+LOG_TOLERANCE = 1e-9
 
 def dag_longest_path(graph: Digraph, start: Node, end: Node) -> int:
+    # topological order of the nodes reachable from start (iterative DFS)
     topological_nodes = []
-    visited = set()
-    def visit(nodes):
-        for node in nodes:
-            if node in visited: continue
-            visited.add(node)
-            visit(adj for adj, _ in graph.get(node, []))
+    visited = { start }
+    stack = [ (start, iter(graph.get(start, []))) ]
+    while stack:
+        node, edges = stack[-1]
+        for adj, _ in edges:
+            if adj not in visited:
+                visited.add(adj)
+                stack.append((adj, iter(graph.get(adj, []))))
+                break
+        else:
+            stack.pop()
             topological_nodes.append(node)
-    visit(graph)
 
-    distances = { start: 1 }
+    # best path to every node, as (sum of log(D), previous node, D)
+    best: dict[Node, tuple[float, Optional[Node], int]] = { start: (0.0, None, 1) }
+    # exact products, only for nodes whose best path is final (already visited)
+    products: dict[Node, int] = {}
+    def exact(node: Node) -> int:
+        path = []
+        while node is not None and node not in products:
+            path.append(node)
+            _, node, _ = best[node]
+        product = 1 if node is None else products[node]
+        for node in reversed(path):
+            product *= best[node][2]
+            products[node] = product
+        return product
+
     for node in reversed(topological_nodes):
+        score, _, _ = best[node]
         for adj, D in graph.get(node, []):
-            subdistance = distances.get(node, 0) * D
-            if distances.get(adj, 0) < subdistance:
-                distances[adj] = subdistance
-    return distances[end]
+            subscore = score + math.log(D)
+            if adj in best:
+                current, prev, current_D = best[adj]
+                if subscore < current - LOG_TOLERANCE * (1 + abs(current)):
+                    continue
+                # too close to tell apart by logs, so compare the exact products
+                if subscore <= current + LOG_TOLERANCE * (1 + abs(current)):
+                    if exact(node) * D <= exact(prev) * current_D:
+                        continue
+            best[adj] = (subscore, node, D)
+    return exact(end)
 
 if __name__ == '__main__': main()
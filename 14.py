@@ -2,18 +2,28 @@
 
 import sys
 import re
-from math import gcd
-from typing import Literal, Union
-from functools import reduce
-from z3 import Int, IntVal, Or, Solver, unsat
+from math import gcd, prod
+from typing import Iterator, Literal, Optional, Union
+from functools import cache, partial, reduce
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+try:
+    import z3
+except ImportError:
+    z3 = None  # only needed to speed up non-linear equations
 
 
 # PARSING
 # -------
 
 def main():
-    for i in range(int(input())):
-        ans = process_case(input())
+    equations = [ input() for _ in range(int(input())) ]
+    if '--parallel' in sys.argv[1:]:
+        # solve the cases concurrently instead of splitting each search
+        answers = get_pool().map(partial(process_case, split=False), equations)
+    else:
+        answers = map(process_case, equations)
+    for i, ans in enumerate(answers):
         print(f'Case #{i+1}: {ans}')
 
 # an expression is either a string (sequence of letters),
@@ -66,9 +76,8 @@ def parse_value(expr: str) -> tuple[str, Expression]:
 # SIMPLIFICATION
 # --------------
 
-# SMT solvers should be able to handle these equations
-# except for divisions, which are non-linear, but these
-# are trivial to remove from the equation
+# divisions are trivial to remove from the equation, and the
+# result is usually linear (which is easy to solve, see below)
 
 ExpressionPath = tuple[tuple[str, int, Expression], ...]
 ExpressionZipper = tuple[ ExpressionPath, Expression ]
@@ -105,118 +114,297 @@ def read_factors(expr: Expression) -> list[Expression]:
 # SOLVING
 # -------
 
-def process_case(equation: str) -> int:
-    # transform parsed equation into Z3 LIA equation
+def read_words(expr: Expression) -> Iterator[str]:
+    if type(expr) is str:
+        yield expr
+    if type(expr) is tuple:
+        for subexpr in expr[1:3]:
+            yield from read_words(subexpr)
+
+def process_case(equation: str, split=True) -> int:
+    expr = original_expr = parse_equation(equation)
+    divisors = []
+    while (result := remove_divisions(((), expr)))[1]:
+        (_, expr), subdivisors = result
+        divisors += subdivisors
+    factors = list(dict.fromkeys(read_factors(expr)))
+
+    words = [ x for e in factors + divisors for x in read_words(e) ]
+    letters = list(dict.fromkeys(''.join(words)))
+    zero_forbidden = { x[0] for x in words if len(x) > 1 }
+    assert len(letters) <= 10
+
+    # the product is 0 if any of its factors is. when all of them are
+    # linear (which is most of the time) they're solved natively, if not
+    # we brute force, using Z3 (if available) to restrict the domains first
 
-    variables = {}
-    def get_variable(x: str):
-        if x not in variables:
-            variables[x] = Int(x)
-        return variables[x]
-    zero_forbidden = set()
+    forms = [ linear_form(factor) for factor in factors ]
+    if all(form is not None for form in forms):
+        raw_solutions = solve_linear(forms, letters, zero_forbidden)
+    else:
+        domains = restrict_domains(factors, divisors, letters, zero_forbidden)
+        raw_solutions = brute_force(expr, domains, split)
+    raw_solutions = [ trans for trans in raw_solutions
+        if all(is_nonzero(divisor, trans) for divisor in divisors) ]
+
+    # format & sort solutions
+
+    solutions = []
+
+    for trans in raw_solutions:
+        solution = ''.join( trans.get(l, l) for l in equation )
+        if check_expr(original_expr, trans):
+            solutions.append(solution)
+        else:
+            print(f'WARNING: skipping solution {solution} as it does not verify...', file=sys.stderr)
+
+    return ';'.join(sorted(solutions)) if solutions else 'IMPOSSIBLE'
+
+def is_nonzero(expr: Expression, trans: dict[str, str]) -> bool:
+    try:
+        return eval_expr(expr, trans) != 0
+    except ValueError:
+        return True  # inexact division, check_expr will reject it
+    except ZeroDivisionError:
+        return False
+
+# linear expressions are solved column by column, like we would by
+# hand: once all letters of a column are assigned, its sum (plus the
+# carry from the previous one) has to be a multiple of 10, and gives
+# the carry for the next column. digits are assigned with all-different
+# pruning: a letter whose remaining digits are all used kills the branch
+
+LinearForm = dict[str, int]  # word -> coefficient ('' for the constant term)
+
+def linear_form(expr: Expression) -> Optional[LinearForm]:
+    if type(expr) is str:
+        return { expr: 1 }
+    if type(expr) is int:
+        return { '': expr }
+    if type(expr) is tuple:
+        op, a, b = expr
+        if (a := linear_form(a)) is None or (b := linear_form(b)) is None:
+            return None
+        if op in '+-':
+            sign = 1 if op == '+' else -1
+            out = dict(a)
+            for word, coef in b.items():
+                out[word] = out.get(word, 0) + sign * coef
+            return out
+        if op == '*':
+            if set(a) <= {''}:
+                a, b = b, a
+            if set(b) <= {''}:
+                return { word: coef * b.get('', 0) for word, coef in a.items() }
+        return None  # non-linear (divisions have been removed before)
+    raise AssertionError()
+
+def solve_linear(forms: list[LinearForm], letters: list[str], zero_forbidden: set[str]) -> list[dict[str, str]]:
+    '''find the assignments of letters that make any of the forms 0'''
+    solutions = {}
+    for form in forms:
+        for trans in solve_columns(form, letters, zero_forbidden):
+            solutions[tuple(sorted(trans.items()))] = trans
+    return list(solutions.values())
+
+def solve_columns(form: LinearForm, letters: list[str], zero_forbidden: set[str]) -> Iterator[dict[str, str]]:
+    ncolumns = max(map(len, form), default=0)
+    columns = [ {} for _ in range(ncolumns) ]
+    for word, coef in form.items():
+        for column, l in zip(columns, reversed(word)):
+            column[l] = column.get(l, 0) + coef
+    columns = [ [ (l, coef) for l, coef in column.items() if coef ] for column in columns ]
+
+    # assign letters in column order (the rest, which only appear in
+    # other factors, are free and go last); then check each column as
+    # soon as it (and the ones before it) are fully assigned
+    order = list(dict.fromkeys(l for column in columns for l, _ in column))
+    order += [ l for l in letters if l not in order ]
+    position = { l: p for p, l in enumerate(order) }
+    checks = [ [] for _ in range(len(order) + 1) ]  # columns to check after assigning p letters
+    ready = 0
+    for n, column in enumerate(columns):
+        ready = max([ ready ] + [ position[l] + 1 for l, _ in column ])
+        checks[ready].append(n)
+    column_terms = [ [ (position[l], coef) for l, coef in column ] for column in columns ]
+    allowed = [ 0x3FE if l in zero_forbidden else 0x3FF for l in order ]
+    digits = [ 0 ] * len(order)
+    constant = form.get('', 0)
+
+    def check(p: int, carry: int) -> Optional[int]:
+        for n in checks[p]:
+            total = carry + sum(coef * digits[q] for q, coef in column_terms[n])
+            if n == 0: total += constant
+            if total % 10: return None
+            carry = total // 10
+        if p == len(order) and carry:
+            return None  # the number left after the last column has to be 0 too
+        return carry
+
+    def assign(p: int, used: int, carry: int):
+        if (carry := check(p, carry)) is None:
+            return
+        if p == len(order):
+            yield { l: str(d) for l, d in zip(order, digits) }
+            return
+        # all-different pruning
+        if any(not (allowed[q] & ~used) for q in range(p, len(order))):
+            return
+        candidates = allowed[p] & ~used
+        for d in range(10):
+            if candidates >> d & 1:
+                digits[p] = d
+                yield from assign(p + 1, used | (1 << d), carry)
 
+    yield from assign(0, 0, 0)
+
+# for non-linear expressions, we use Z3 to restrict the domain
+# of every digit, then brute force the remaining combinations
+
+def restrict_domains(factors: list[Expression], divisors: list[Expression],
+        letters: list[str], zero_forbidden: set[str]) -> dict[str, list[int]]:
+    domains = { l: [ d for d in range(10) if d or l not in zero_forbidden ] for l in letters }
+    if z3 is None:
+        return domains
+
+    # transform parsed equation into Z3 LIA equation
+    variables = { l: z3.Int(l) for l in letters }
     def transform_expression(x: Expression):
         if type(x) is str:
-            if len(x) > 1:
-                zero_forbidden.add(x[0])
-            return reduce(lambda out, var: out * 10 + var, map(get_variable, x))
+            return reduce(lambda out, var: out * 10 + var, (variables[l] for l in x))
         if type(x) is tuple:
             op, *vs = x
             a, b = map(transform_expression, vs)
             return { '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b }[op]()
         if type(x) is int:
-            return IntVal(x)
+            return z3.IntVal(x)
         raise AssertionError()
 
     # set up the solver with the transformed equation + constraints
-
-    expr = original_expr = parse_equation(equation)
-    divisors = []
-    while (result := remove_divisions(((), expr)))[1]:
-        (_, expr), subdivisors = result
-        divisors += subdivisors
-
-    solver = Solver()
-    solver_expr = Or(*(transform_expression(factor) == 0
-        for factor in set(read_factors(expr))))
-    solver.add(solver_expr)
+    solver = z3.Solver()
+    solver.add(z3.Or(*(transform_expression(factor) == 0 for factor in factors)))
     for divisor in divisors:
         solver.add(transform_expression(divisor) != 0)
-
     for l, var in variables.items():
         solver.add( var >= (1 if l in zero_forbidden else 0) )
         solver.add( var < 10 )
-
-    assert len(variables) <= 10
-    keys = list(variables)
-    for idx1 in range(len(keys)):
-        for idx2 in range(idx1):
-            solver.add(variables[keys[idx1]] != variables[keys[idx2]])
+    solver.add(z3.Distinct(*variables.values()))
 
     # restrict domain of every digit using solver
-
-    domains = { l: list(range(10)) for l in variables }
     solver.set(timeout=100)
     for l, var in variables.items():
-        for idx in range(10):
+        for idx in list(domains[l]):
             status = solver.check(var == idx)
-            if status == unsat:
+            if status == z3.unsat:
                 domains[l].remove(idx)
+    return domains
 
-    # brute force
-
-    raw_solutions = []
+def brute_force(expr: Expression, domains: dict[str, list[int]], split=True) -> list[dict[str, str]]:
+    # every combination is generated as a row of a digit matrix, then
+    # evaluated in batches of rows. big searches are split on the digits
+    # of the first letters, and the parts are spread over a process pool
     keys, domains = zip(*sorted(domains.items(), key=lambda x: len(x[1])))
-    ndomains = len(domains)
-    trans = {}
-    used = []
-
-    def try_domain(key: int=0):
-        if key == ndomains:
-            if eval_expr(expr, trans) == 0:
-                raw_solutions.append(dict(trans))
-            return
-        for idx in domains[key]:
-            for idx2 in used:
-                if idx == idx2:
-                    break
-            else:
-                used.append(idx)
-                trans[keys[key]] = str(idx)
-                try_domain(key + 1)
-                used.pop()
-
-    try_domain()
-
-    # format & sort solutions
-
-    solutions = []
-
-    for trans in raw_solutions:
-        solution = ''.join( trans.get(l, l) for l in equation )
-        if check_expr(original_expr, trans):
-            solutions.append(solution)
-        else:
-            print(f'WARNING: skipping solution {solution} as it does not verify...', file=sys.stderr)
-
-    return ';'.join(sorted(solutions)) if solutions else 'IMPOSSIBLE'
+    prefixes = [ tuple(map(int, row)) for row in candidate_matrix(domains[:SPLIT_LETTERS]) ]
+    if split and prod(map(len, domains)) > SPLIT_THRESHOLD and len(prefixes) > 1:
+        n = len(prefixes)
+        parts = get_pool().map(search_prefix, [expr] * n, [keys] * n, [domains] * n, prefixes)
+    else:
+        parts = [ search_prefix(expr, keys, domains, ()) ]
+    return [ trans for part in parts for trans in part ]
+
+SPLIT_LETTERS = 2
+SPLIT_THRESHOLD = 10**6  # combinations (before all-different) to go parallel
+BATCH_SIZE = 1 << 16
+
+def search_prefix(expr: Expression, keys: tuple[str, ...], domains: tuple[list[int], ...],
+        prefix: tuple[int, ...]) -> list[dict[str, str]]:
+    '''brute force the combinations whose first letters get the digits in prefix'''
+    rest = [ [ d for d in domain if d not in prefix ] for domain in domains[len(prefix):] ]
+    candidates = candidate_matrix(rest)
+    candidates = np.column_stack([ np.tile(np.array(prefix, dtype=np.int8), (len(candidates), 1)), candidates ])
+    raw_solutions = []
+    for pos in range(0, len(candidates), BATCH_SIZE):
+        batch = candidates[pos:pos + BATCH_SIZE]
+        values, valid = eval_batch(expr, keys, batch)
+        for row in batch[valid & (values == 0)]:
+            raw_solutions.append({ l: str(d) for l, d in zip(keys, row) })
+    return raw_solutions
+
+@cache
+def get_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor()
+
+def candidate_matrix(domains: list[list[int]]) -> np.ndarray:
+    '''every assignment of distinct digits from the domains, one per row'''
+    rows = np.zeros((1, 0), dtype=np.int8)
+    for domain in domains:
+        blocks = [ np.zeros((0, rows.shape[1] + 1), dtype=np.int8) ]
+        for d in domain:
+            free = rows[(rows != d).all(axis=1)]
+            blocks.append(np.column_stack([ free, np.full(len(free), d, dtype=np.int8) ]))
+        rows = np.concatenate(blocks)
+    return rows
+
+# EVALUATION
+# ----------
+
+# expressions are compiled (once) into a Python function taking the
+# digit of every letter, in the order of `letters`. the same function
+# evaluates a whole batch of assignments if passed NumPy columns.
+# `invalid` collects the rows where a division isn't exact (scalars raise)
+
+def exact_div(a, b, invalid: Optional[np.ndarray]):
+    if invalid is None:
+        q, m = divmod(a, b)
+        if m: raise ValueError('invalid division')
+        return q
+    zero = b == 0
+    b = np.where(zero, 1, b)
+    invalid |= zero | (a % b != 0)
+    return a // b
+
+@cache
+def compile_expr(expr: Expression, letters: tuple[str, ...]):
+    slots = { l: n for n, l in enumerate(letters) }
+    def source(x: Expression) -> str:
+        if type(x) is str:
+            return '(' + ' + '.join(f'd[{slots[l]}] * {10**p}' for p, l in enumerate(reversed(x))) + ')'
+        if type(x) is int:
+            return repr(x)
+        if type(x) is tuple:
+            op, a, b = x
+            if op == '/':
+                return f'exact_div({source(a)}, {source(b)}, invalid)'
+            return f'({source(a)} {op} {source(b)})'
+        raise AssertionError()
+    return eval(f'lambda d, invalid: {source(expr)}', { 'exact_div': exact_div })
 
-def eval_expr(expr: Expression, trans: dict[str, str]) -> int:
+def expr_bound(expr: Expression) -> int:
+    '''upper bound for the absolute value of expr (or of any subexpression)'''
     if type(expr) is str:
-        # assert len(expr) == 1 or trans[expr[0]] != 0
-        return int(''.join( trans[x] for x in expr ))
+        return 10**len(expr)
     if type(expr) is int:
-        return expr
+        return abs(expr)
     if type(expr) is tuple:
-        a, b = (eval_expr(x, trans) for x in expr[1:])
-        def safe_div():
-            q, m = divmod(a, b)
-            if m: raise ValueError('invalid division')
-            return q
-        ops = { '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b, '/': safe_div }
-        return ops[expr[0]]()
+        op, a, b = expr
+        a, b = expr_bound(a), expr_bound(b)
+        return { '+': a + b, '-': a + b, '*': a * b, '/': max(a, b) }[op]
     raise AssertionError()
 
+def eval_batch(expr: Expression, letters: tuple[str, ...], digits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''evaluate expr for every row of digits, returning (values, valid)'''
+    # use Python ints if the values could overflow
+    dtype = np.int64 if expr_bound(expr) < 2**62 else object
+    columns = [ digits[:, n].astype(dtype) for n in range(len(letters)) ]
+    invalid = np.zeros(len(digits), dtype=bool)
+    values = compile_expr(expr, tuple(letters))(columns, invalid)
+    values = np.broadcast_to(np.asarray(values, dtype=dtype), (len(digits),))
+    return values, ~invalid
+
+def eval_expr(expr: Expression, trans: dict[str, str]) -> int:
+    letters = tuple(sorted(set(''.join(read_words(expr)))))
+    return compile_expr(expr, letters)([ int(trans[l]) for l in letters ], None)
+
 def check_expr(expr: Expression, trans: dict[str, str]):
     assert len(set(trans.values())) == len(trans)
     assert all(len(v) == 1 for v in trans.values())
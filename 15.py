@@ -1,26 +1,65 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import mmap
+from functools import cache
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
 def main():
+    use_table = '--no-table' not in sys.argv[1:]
     for i in range(int(input())):
-        ans = process_case(int(input()))
+        ans = process_case(int(input()), use_table)
         print(f'Case #{i+1}: {ans}')
 
 M = 10**8 + 7  # prime
 
-# naive way... at 1e8 it's not worth it to use anything else
+# naive way... at 1e8 it's not worth it to use anything else.
+# except when there's many queries: the product up to every multiple
+# of CHECKPOINT_STRIDE is computed once and stored in a file, so that
+# a query only needs to walk from the nearest checkpoint below it.
+# to generate that table (or to answer without it, with --no-table) the
+# range is split into blocks, which are multiplied with NumPy in a
+# process pool
+
+CHECKPOINT_STRIDE = 10**5
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    f'15.checkpoints.{CHECKPOINT_STRIDE}.bin')
 
-def process_case(n: int) -> int:
+BLOCK_SIZE = 10**6  # must divide 10**6, so blocks line up with excluded ranges
+
+def process_case(n: int, use_table=True) -> int:
     # M is not a tuentistic number, so if it gets included
     # the product drops to 0
     if n >= M: return 0
 
+    if not use_table:
+        return range_product(1, n)
+    k = n // CHECKPOINT_STRIDE
+    checkpoint = int.from_bytes(load_checkpoints()[k*4:(k+1)*4], 'little')
+    return walk(checkpoint, k * CHECKPOINT_STRIDE + 1, n)
+
+def skip_excluded(i: int) -> int:
+    '''if i is not tuentistic, move it to the next number that (possibly) is'''
+    # jumping to the end of a range never lands in a smaller range
+    for scale in (10**6, 10**3, 1):
+        if 20 <= (i // scale) % 100 < 30:
+            i = (i // (scale * 10) + 1) * (scale * 10)
+    return i
+
+def walk(product: int, i: int, n: int) -> int:
+    '''multiply product by every tuentistic number in [i, n]'''
+    i = skip_excluded(i)
+
     # The code looks messy but it's worth to use counters here (since
     # mods / divisions would otherwise take most of the time).
     # But CPython is SO SLOW that the algorithm improvement gets lost
     # in the VM's overhead. In PyPy it's about 10x faster with counters.
-    product = 1
-    i = 1
-    ctr1, ctr2, ctr3 = 80 + 1, 80 * 1000 + 1, 80 * 1000**2 + 1
+    # Every counter hits 100 (or 100_000, ...) when i enters its excluded range
+    ctr1 = (i + 80 - 1) % 100 + 1
+    ctr2 = (i + 80 * 1000 - 1) % 100_000 + 1
+    ctr3 = (i + 80 * 1000**2 - 1) % 100_000_000 + 1
     while i <= n:
         if ctr1 == 100:
             i += 10; ctr1 = 10; ctr2 += 10; ctr3 += 10
@@ -34,4 +73,71 @@ def process_case(n: int) -> int:
             i += 1; ctr1 += 1; ctr2 += 1; ctr3 += 1
     return product
 
+def block_product(bounds: tuple[int, int]) -> int:
+    '''multiply every tuentistic number in [lo, hi]'''
+    lo, hi = bounds
+    x = np.arange(lo, hi + 1, dtype=np.uint64)
+    for scale in (1, 10**3, 10**6):
+        digits = (x // np.uint64(scale)) % np.uint64(100)
+        x = x[(digits < 20) | (digits >= 30)]
+    # tree reduce; both factors are < M, so the product fits in 63 bits
+    while len(x) > 1:
+        if len(x) % 2:
+            x = np.append(x, np.uint64(1))
+        x = (x[0::2] * x[1::2]) % np.uint64(M)
+    return int(x[0]) if len(x) else 1
+
+def block_products(blocks: list[tuple[int, int]]) -> list[int]:
+    '''call block_product on every block, in parallel if there's many'''
+    # blocks inside an excluded range of millions multiply to 1
+    excluded = lambda lo, hi: hi // 10**6 == lo // 10**6 and 20 <= (lo // 10**6) % 100 < 30
+    todo = [ n for n, (lo, hi) in enumerate(blocks) if not excluded(lo, hi) ]
+    products = [1] * len(blocks)
+    if len(todo) > 1:
+        results = get_pool().map(block_product, [ blocks[n] for n in todo ])
+    else:
+        results = map(block_product, [ blocks[n] for n in todo ])
+    for n, product in zip(todo, results):
+        products[n] = product
+    return products
+
+def range_product(lo: int, hi: int) -> int:
+    '''multiply every tuentistic number in [lo, hi]'''
+    blocks = [ (max(lo, start), min(hi, start + BLOCK_SIZE - 1))
+        for start in range(lo // BLOCK_SIZE * BLOCK_SIZE, hi + 1, BLOCK_SIZE) ]
+    product = 1
+    for x in block_products(blocks):
+        product = (product * x) % M
+    return product
+
+@cache
+def get_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor()
+
+@cache
+def load_checkpoints() -> mmap.mmap:
+    '''map the checkpoint table (generating it first if needed)'''
+    # entry k is the product up to k * CHECKPOINT_STRIDE, as little-endian uint32
+    size = (M // CHECKPOINT_STRIDE + 1) * 4
+    if not os.path.exists(CHECKPOINT_FILE) or os.path.getsize(CHECKPOINT_FILE) != size:
+        generate_checkpoints(CHECKPOINT_FILE)
+    with open(CHECKPOINT_FILE, 'rb') as f:
+        table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    assert len(table) == size
+    return table
+
+def generate_checkpoints(filename: str):
+    blocks = [ ((k - 1) * CHECKPOINT_STRIDE + 1, k * CHECKPOINT_STRIDE)
+        for k in range(1, M // CHECKPOINT_STRIDE + 1) ]
+    product = 1
+    entries = [ product ]
+    for x in block_products(blocks):
+        product = (product * x) % M
+        entries.append(product)
+    # write to a temporary file first, so an interrupted run doesn't leave a broken table
+    data = b''.join(x.to_bytes(4, 'little') for x in entries)
+    with open(tmp_filename := f'{filename}.{os.getpid()}.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(tmp_filename, filename)
+
 if __name__ == '__main__': main()
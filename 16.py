@@ -2,12 +2,13 @@
 
 import socket
 import math
-from dataclasses import dataclass
-from typing import Optional, TextIO, Union
-import copy
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, TextIO, Union
 from collections import defaultdict
+from functools import cache
 import random
 import itertools
+import heapq
 
 SERVER = ('codechallenge-daemons.0x14.net', 7162)
 
@@ -17,21 +18,48 @@ SERVER = ('codechallenge-daemons.0x14.net', 7162)
 
 Prime = int
 Factorization = dict[Prime, int]
-
-is_prime = lambda x: all(x % m != 0 for m in range(2, math.isqrt(x)+1))
-
-def factorize(n: int, primes: list[int]) -> Factorization:
+Bitset = int  # set of small numbers, as bits of an int
+
+# exponent vectors (of the primes up to N) are stored in unary, so that
+# gcd / lcm are just & / |. bit (k - 1) * len(primes) + j is set if the
+# exponent of the j-th prime is at least k
+Exponents = Bitset
+
+def bits(mask: Bitset) -> Iterator[int]:
+    digits = bin(mask)[:1:-1]  # from the lowest bit
+    i = digits.find('1')
+    while i >= 0:
+        yield i
+        i = digits.find('1', i + 1)
+
+def to_bitset(xs: Iterator[int], size: int) -> Bitset:
+    '''bitset of the numbers (below size) in xs'''
+    buf = bytearray(size // 8 + 1)
+    for x in xs:
+        buf[x >> 3] |= 1 << (x & 7)
+    return int.from_bytes(buf, 'little')
+
+@cache
+def sieve(N: int) -> list[int]:
+    '''smallest prime factor of every number up to N (1 for 1)'''
+    spf = list(range(N + 1))
+    for p in range(2, math.isqrt(N) + 1):
+        if spf[p] == p:
+            for m in range(p * p, N + 1, p):
+                if spf[m] == m:
+                    spf[m] = p
+    return spf
+
+# (1 counts as prime here, since it's also a target)
+is_prime = lambda x, spf: spf[x] == x
+
+def factorize(n: int, spf: list[int]) -> Factorization:
     assert n > 0
-    primes_iter = iter(primes)
     factors = {}
     while n != 1:
-        prime = next(primes_iter)
-        exp = 0
-        while n % prime == 0:
-            n //= prime
-            exp += 1
-        if exp:
-            factors[prime] = exp
+        prime = spf[n]
+        factors[prime] = factors.get(prime, 0) + 1
+        n //= prime
     return factors
 
 
@@ -62,7 +90,8 @@ class LocalJudge(object):
         return math.gcd( self.permutation[a - 1], self.permutation[b - 1] )
 
     def send_answer(self, ixs: set[int]):
-        assert all(is_prime(self.permutation[i - 1]) for i in ixs), 'answer is not correct'
+        spf = sieve(self.N)
+        assert all(is_prime(self.permutation[i - 1], spf) for i in ixs), 'answer is not correct'
 
 class RemoteJudge(object):
     conn: socket.socket
@@ -103,72 +132,207 @@ class RemoteJudge(object):
 # SOLVER STATE
 # ------------
 
+# domains are bitsets of the values (and groups of cells, bitsets of
+# the cells), factor bounds are exponent vectors, so that the rules
+# are mostly mask operations
+
 @dataclass
 class CellState(object):
-    min_factors: int
-    max_factors: int
-    domain: set[int]
+    min_factors: Exponents
+    max_factors: Exponents
+    domain: Bitset
     is_target: Optional[bool]
 
-    def add_factors(self, n: int):
-        self.min_factors = math.lcm(self.min_factors, n)
-    def restrict_factors(self, n: int):
-        self.max_factors = math.gcd(self.max_factors, n)
-
-    def check_max(self, n: int) -> bool:
-        return self.max_factors % n == 0
-    def check_min(self, n: int) -> bool:
-        return n % self.min_factors == 0
-
     def check(self):
         assert self.domain
-        assert self.max_factors > 0 and self.min_factors > 0
-        assert self.max_factors % self.min_factors == 0
+        assert not self.min_factors & ~self.max_factors
+
+Query = tuple[int, int]
+Score = tuple[int, int, int]
 
 @dataclass
 class SolverState(object):
     # precalculated info depending on N and Q, never touched
     primes: list[int]
     indexes: dict[int, Factorization]
-    targets: set[int]
+    targets: Bitset
+    full: Bitset  # all of 1..N
+    exponents: list[Exponents]  # value -> its exponents
+    max_exponents: Exponents  # lcm of all values
+    divisible: dict[int, Bitset]  # exponent bit -> values having it
 
     # absolute info we have from server; rules do not touch this
-    queries: dict[tuple[int, int], int]
+    queries: dict[Query, int]
 
     cells: dict[int, CellState]
 
+    # indexes over the cells, kept up to date by update_cell()
+    cell_queries: dict[int, list[Query]] = field(default_factory=lambda: defaultdict(list))
+    domain_groups: dict[Bitset, Bitset] = field(default_factory=lambda: defaultdict(int))  # domain -> cells
+    acceptors: dict[int, Bitset] = field(default_factory=lambda: defaultdict(int))  # value -> cells accepting it
+    acceptor_groups: dict[Bitset, Bitset] = field(default_factory=lambda: defaultdict(int))  # acceptors -> values
+    target_counts: dict[bool, int] = field(default_factory=lambda: { True: 0, False: 0 })
+
+    # work pending for the rules: what changed since they last looked at it
+    changed_cells: set[int] = field(default_factory=set)
+    changed_values: set[int] = field(default_factory=set)
+    changed_queries: set[Query] = field(default_factory=set)
+
+    # candidate queries by score (see pick_query), and cells to rescore
+    query_scores: dict[Query, Score] = field(default_factory=dict)
+    query_heap: list[tuple[Score, Query]] = field(default_factory=list)  # (-score, query), possibly stale
+    rescore_cells: set[int] = field(default_factory=set)
+
+    def __post_init__(self):
+        for query in self.queries:
+            for c in query:
+                self.cell_queries[c].append(query)
+        for c, cell in self.cells.items():
+            self.domain_groups[cell.domain] |= 1 << c
+            if cell.is_target is not None:
+                self.target_counts[cell.is_target] += 1
+        for domain, cells in self.domain_groups.items():
+            for i in bits(domain):
+                self.acceptors[i] |= cells
+        for i, cells in self.acceptors.items():
+            self.acceptor_groups[cells] |= 1 << i
+        self.changed_cells |= set(self.cells)
+        self.changed_values |= set(self.acceptors)
+        self.changed_queries |= set(self.queries)
+        self.rescore_cells |= set(self.cells)
+
     @staticmethod
     def initial(N: int):
-        primes = [ p for p in range(2, N + 1) if is_prime(p) ]
-        indexes = { k: factorize(k, primes) for k in range(1, N + 1) }
-        targets = set( k for k, factors in indexes.items() if sum(factors.values()) <= 1 )
-        domain, max_factors = set(indexes), math.lcm(*indexes)
-        return SolverState(primes, indexes, targets, queries={}, cells={
-            k: CellState(1, max_factors, domain.copy(), None) for k in domain })
+        # everything comes from the sieve, in (close to) linear time
+        spf = sieve(N)
+        primes = [ p for p in range(2, N + 1) if is_prime(p, spf) ]
+        position = { p: j for j, p in enumerate(primes) }
+        indexes = { k: factorize(k, spf) for k in range(1, N + 1) }
+        targets = to_bitset((k for k in indexes if is_prime(k, spf)), N + 1)
+        full = to_bitset(indexes, N + 1)
+
+        # the exponents of k are those of k / p plus the next one of p
+        exponents, multiplicity = [ 0, 0 ], [ 0, 0 ]
+        for k in range(2, N + 1):
+            p = spf[k]
+            multiplicity.append(multiplicity[k // p] + 1 if spf[k // p] == p else 1)
+            exponents.append(exponents[k // p] | 1 << ((multiplicity[k] - 1) * len(primes) + position[p]))
+        having = defaultdict(list)
+        for k in indexes:
+            for b in bits(exponents[k]):
+                having[b].append(k)
+        divisible = { b: to_bitset(ks, N + 1) for b, ks in sorted(having.items()) }
+        max_exponents = to_bitset(divisible, max(divisible, default=0) + 1)
+        return SolverState(primes, indexes, targets, full, exponents, max_exponents, divisible, queries={}, cells={
+            k: CellState(0, max_exponents, full, None) for k in indexes })
+
+    def prime_mask(self, exponents: Exponents) -> Bitset:
+        '''primes (by position) with nonzero exponent'''
+        mask, all_primes = 0, (1 << len(self.primes)) - 1
+        while exponents:
+            mask |= exponents & all_primes
+            exponents >>= len(self.primes)
+        return mask
+
+    def all_exponents(self, mask: Bitset) -> Exponents:
+        '''exponent bits of the primes (by position) in mask'''
+        out = 0
+        for shift in range(0, self.max_exponents.bit_length(), len(self.primes) or 1):
+            out |= mask << shift
+        return out & self.max_exponents
+
+    def count_greater(self, a: Exponents, b: Exponents) -> int:
+        '''number of primes with a greater exponent in a than in b'''
+        return self.prime_mask(a & ~b).bit_count()
+
+    def factors_mask(self, min_factors: Exponents, max_factors: Exponents) -> Bitset:
+        '''values whose exponents are within the bounds'''
+        mask = self.full
+        for b in bits(min_factors):
+            mask &= self.divisible[b]
+        for b in bits(self.max_exponents & ~max_factors):
+            mask &= ~self.divisible[b]
+        return mask
+
+    def domain_factors(self, domain: Bitset) -> tuple[Exponents, Exponents]:
+        '''exponents of the gcd and lcm of the values in domain'''
+        gcd, lcm = 0, 0
+        for b, divisible in self.divisible.items():
+            if not domain & ~divisible:
+                gcd |= 1 << b
+            if domain & divisible:
+                lcm |= 1 << b
+        return gcd, lcm
+
+    def add_query(self, query: Query, result: int):
+        self.queries[query] = result
+        self.query_scores.pop(query, None)
+        for c in query:
+            self.cell_queries[c].append(query)
+        self.changed_queries.add(query)
+
+    def update_cell(self, c: int, min_factors: Optional[Exponents]=None, max_factors: Optional[Exponents]=None,
+            domain: Optional[Bitset]=None):
+        '''change the state of a cell, and schedule the rules that depend on it'''
+        cell = self.cells[c]
+        factors = (cell.min_factors if min_factors is None else min_factors,
+                   cell.max_factors if max_factors is None else max_factors)
+        if factors != (cell.min_factors, cell.max_factors):
+            cell.min_factors, cell.max_factors = factors
+            self.changed_cells.add(c)
+            self.rescore_cells.add(c)
+            self.changed_queries.update(self.cell_queries[c])
+        if domain is not None and domain != cell.domain:
+            self.__regroup(self.domain_groups, cell.domain, domain, c)
+            for i in bits(cell.domain & ~domain):
+                acceptors = self.acceptors[i]
+                self.__regroup(self.acceptor_groups, acceptors, acceptors & ~(1 << c), i)
+                self.acceptors[i] = acceptors & ~(1 << c)
+                self.changed_values.add(i)
+            cell.domain = domain
+            self.changed_cells.add(c)
+
+    @staticmethod
+    def __regroup(groups: dict[Bitset, Bitset], old: Bitset, new: Bitset, x: int):
+        groups[old] &= ~(1 << x)
+        if not groups[old]:
+            del groups[old]
+        groups[new] |= 1 << x
+
+    def set_target(self, c: int, is_target: bool):
+        cell = self.cells[c]
+        assert cell.is_target in { None, is_target }
+        if cell.is_target is None:
+            cell.is_target = is_target
+            self.target_counts[is_target] += 1
+            self.rescore_cells.add(c)
 
     def dump(self):
         print('\n-- SOLVER STATE --')
         indexes = self.indexes
-        initial_cell = CellState(1, math.lcm(*indexes), set(indexes).copy(), None)
+        initial_cell = CellState(0, self.max_exponents, self.full, None)
         for c, cell in self.cells.items():
             if cell == initial_cell:
                 continue
-            label, domain = ('ONLY', cell.domain) if len(cell.domain) < len(indexes) / 2 \
-                else ('DISCARDED', set(indexes) - cell.domain)
-            domain = f'{len(domain)} {label}: ' + ", ".join(map(str, sorted(domain)))
-            factors = self.__format_factors(cell, initial_cell.max_factors)
+            label, domain = ('ONLY', cell.domain) if cell.domain.bit_count() < len(indexes) / 2 \
+                else ('DISCARDED', self.full & ~cell.domain)
+            domain = f'{domain.bit_count()} {label}: ' + ", ".join(map(str, bits(domain)))
+            factors = self.__format_factors(cell)
             target = { True: 'YES', False: 'NO', None: '' }[cell.is_target]
             print(f' [{c:3}] = {factors:15}   {target:3}   {domain}')
         print()
 
-    def __format_factors(self, cell: CellState, max_factors: int) -> str:
-        fmin = factorize(cell.min_factors, self.primes)
-        fmax = factorize(cell.max_factors, self.primes)
-        show = (len(fmin), len(fmax)) != (0, len(self.primes))
-        return f'{len(fmin):2} - {len(fmax):2} factors' if show else ''
+    def __format_factors(self, cell: CellState) -> str:
+        fmin = self.prime_mask(cell.min_factors).bit_count()
+        fmax = self.prime_mask(cell.max_factors).bit_count()
+        show = (fmin, fmax) != (0, len(self.primes))
+        return f'{fmin:2} - {fmax:2} factors' if show else ''
 
     def check(self):
-        assert set().union(*(c.domain for c in self.cells.values())) == set(self.indexes)
+        union = 0
+        for c in self.cells.values():
+            union |= c.domain
+        assert union == self.full
         for c in self.cells.values(): c.check()
 
 
@@ -178,83 +342,80 @@ class SolverState(object):
 # it really looks like I want a SAT solver here,
 # but I find it hard to adapt to the strategy part
 
-def queries_to_factors(st: SolverState):
+# rules only look at the cells (and queries, values) that changed
+# since they last ran, see solve()
+
+def queries_to_factors(st: SolverState, queries: set[Query]):
     '''discover factor restrictions from queries'''
-    for cells, common in st.queries.items():
+    for cells in queries:
+        common = st.exponents[st.queries[cells]]
+
         # factors that are in query -> in both A and B
         for c in cells:
-            st.cells[c].add_factors(common)
+            st.update_cell(c, min_factors=st.cells[c].min_factors | common)
 
         # factors that are in A but not in query -> not in B
         for a, b in (cells, cells[::-1]):
-            ref = st.cells[a].min_factors
-            ref //= math.gcd(ref, common)
-            b_max = factorize(st.cells[b].max_factors, st.primes)
-            for f in st.indexes[ref]:
-                b_max[f] = min(b_max.get(f, 0), st.indexes[common].get(f, 0))
-            st.cells[b].max_factors = math.prod(f**v for f, v in b_max.items())
-
-def factors_to_domain(st: SolverState):
+            ref = st.all_exponents(st.prime_mask(st.cells[a].min_factors & ~common))
+            st.update_cell(b, max_factors=st.cells[b].max_factors & (common | ~ref))
+
+def factors_to_domain(st: SolverState, cells: set[int]):
     '''discover domain restrictions from factors'''
-    for cell in st.cells.values():
-        cell.domain = { i for i in cell.domain if cell.check_min(i) and cell.check_max(i) }
+    for c in cells:
+        cell = st.cells[c]
+        st.update_cell(c, domain=cell.domain & st.factors_mask(cell.min_factors, cell.max_factors))
 
-def domain_to_factors(st: SolverState):
+def domain_to_factors(st: SolverState, cells: set[int]):
     '''discover factor restrictions from domain'''
-    for cell in st.cells.values():
-        cell.restrict_factors(math.lcm(*cell.domain))
-        cell.add_factors(math.gcd(*cell.domain))
-
-def domain_exclusivity(st: SolverState):
+    for c in cells:
+        cell = st.cells[c]
+        gcd, lcm = st.domain_factors(cell.domain)
+        st.update_cell(c,
+            min_factors=cell.min_factors | gcd,
+            max_factors=cell.max_factors & lcm)
+
+def domain_exclusivity(st: SolverState, cells: set[int], values: set[int]):
     '''discover new domain restrictions from exclusivity'''
     # look for cells that can only accept some values
-    domains: dict[frozenset[int], list[int]] = defaultdict(lambda: [])
-    for c, cell in st.cells.items():
-        domains[frozenset(cell.domain)].append(c)
-    for domain, cells in domains.items():
-        assert len(domain) >= len(cells)
-        if len(domain) == len(cells):
-            for other in set(st.indexes) - set(cells):
-                st.cells[other].domain -= domain
+    for domain in { st.cells[c].domain for c in cells }:
+        group = st.domain_groups.get(domain, 0)
+        assert domain.bit_count() >= group.bit_count()
+        if domain.bit_count() == group.bit_count():
+            others = 0
+            for i in bits(domain):
+                others |= st.acceptors[i]
+            for other in bits(others & ~group):
+                st.update_cell(other, domain=st.cells[other].domain & ~domain)
 
     # look for values that can only be accepted on some cells
-    acceptors_by_val: dict[int, set[int]] = defaultdict(lambda: set())
-    for c, cell in st.cells.items():
-        for i in cell.domain:
-            acceptors_by_val[i].add(c)
-    acceptors: dict[frozenset[int], set[int]] = defaultdict(lambda: set())
-    for i, cells in acceptors_by_val.items():
-        acceptors[frozenset(cells)].add(i)
-    for cells, domain in acceptors.items():
-        assert len(cells) >= len(domain)
-        if len(cells) == len(domain):
-            for cell in cells:
-                st.cells[cell].domain &= domain
-
-def domain_to_target(st: SolverState):
+    for acceptors in { st.acceptors[i] for i in values }:
+        domain = st.acceptor_groups.get(acceptors, 0)
+        assert acceptors.bit_count() >= domain.bit_count()
+        if acceptors.bit_count() == domain.bit_count():
+            for cell in bits(acceptors):
+                st.update_cell(cell, domain=st.cells[cell].domain & domain)
+
+def domain_to_target(st: SolverState, cells: set[int]):
     '''discover target status from domain'''
-    for cell in st.cells.values():
-        possibilities = { i in st.targets for i in cell.domain }
-        if len(possibilities) == 1:
-            is_target = next(iter(possibilities))
-            assert cell.is_target in { None, is_target }
-            cell.is_target = is_target
+    for c in cells:
+        if not (domain := st.cells[c].domain):
+            continue
+        if not domain & ~st.targets:
+            st.set_target(c, True)
+        elif not domain & st.targets:
+            st.set_target(c, False)
 
     # we could do some more advanced stuff by expanding the domain
     # exclusivity rule, but I think we're fine
 
-    counts = defaultdict(lambda: 0)
-    for cell in st.cells.values():
-        if cell.is_target != None:
-            counts[cell.is_target] += 1
-
-    expected_counts = { True: len(st.targets), False: len(st.indexes) - len(st.targets) }
-    for value, count in counts.items():
+    expected_counts = { True: st.targets.bit_count(), False: len(st.indexes) - st.targets.bit_count() }
+    for value, count in st.target_counts.items():
         assert count <= expected_counts[value]
-        if count == expected_counts[value]:
-            for cell in st.cells.values():
+    for value, count in list(st.target_counts.items()):
+        if count == expected_counts[value] and sum(st.target_counts.values()) < len(st.cells):
+            for c, cell in st.cells.items():
                 if cell.is_target == None:
-                    cell.is_target = not value
+                    st.set_target(c, not value)
 
 
 # STRATEGY & MAIN LOOP
@@ -262,37 +423,58 @@ def domain_to_target(st: SolverState):
 
 def solve(st: SolverState):
     '''use solver rules to deduce new info'''
-    # performance isn't an issue here, so do everything possible
-    # until there's nothing else to do (with the info we have)
-    while True:
-        old_st, st = st, copy.deepcopy(st)
-        queries_to_factors(st)
-        factors_to_domain(st)
-        domain_to_factors(st)
-        domain_exclusivity(st)
-        domain_to_target(st)
-        if st == old_st: break
+    # run the rules until there's nothing else to do (with the info we have).
+    # every change schedules the rules that depend on it, so each round
+    # only looks at what changed since the last one
+    take = lambda pending: (set(pending), pending.clear())[0]
+    while st.changed_cells or st.changed_values or st.changed_queries:
+        queries_to_factors(st, take(st.changed_queries))
+        cells = take(st.changed_cells)
+        factors_to_domain(st, cells)
+        domain_to_factors(st, cells)
+        domain_exclusivity(st, cells, take(st.changed_values))
+        domain_to_target(st, cells)
     st.check()
     return st
 
-def pick_query(st: SolverState) -> tuple[int, int]:
+def pick_query(st: SolverState) -> tuple[Query, Score]:
     '''given a solver state, pick the next query'''
     # the solver seems to be smart enough so I haven't thought
     # much about this part tbh. I just pick the query that is
     # guaranteed to give me more info (in factors), favoring
     # cells with unknown target status in case of a tie
-    def get_score(query: tuple[int, int]):
-        cells = [ st.cells[c] for c in query ]
-        fmax = math.gcd(*(c.max_factors for c in cells))
-        fmin = math.gcd(*(c.min_factors for c in cells))
-        missing_factors = lambda a, b: st.indexes[a // math.gcd(a, b)]
-        potential = len(factorize(fmax // math.gcd(fmax, fmin), st.primes))
-        guaranteed1 = len(missing_factors(math.gcd(cells[1].min_factors, fmax), cells[0].min_factors))
-        guaranteed2 = len(missing_factors(math.gcd(cells[0].min_factors, fmax), cells[1].min_factors))
-        return guaranteed1 + guaranteed2, potential, sum(1 for c in cells if c.is_target == None)
-    available = itertools.combinations(st.indexes, 2)
-    available = [ (x, get_score(x)) for x in available if x not in st.queries ]
-    return max(available, key=lambda x: x[1])
+    # (and then the first query, in order).
+    # scores are kept in a heap, and only the queries touching
+    # cells that changed since the last pick are rescored
+    if 2 * len(st.rescore_cells) >= len(st.cells):
+        candidates = itertools.combinations(st.indexes, 2)
+    else:
+        candidates = { tuple(sorted((c, other))) for c in st.rescore_cells for other in st.indexes if other != c }
+    st.rescore_cells.clear()
+    for x in candidates:
+        if x not in st.queries and st.query_scores.get(x) != (score := get_score(st, x)):
+            st.query_scores[x] = score
+            heapq.heappush(st.query_heap, (tuple(-v for v in score), x))
+
+    # drop stale entries, rebuilding the heap if they're most of it
+    heap = st.query_heap
+    if len(heap) > 2 * len(st.query_scores) + 64:
+        heap[:] = [ (tuple(-v for v in score), x) for x, score in st.query_scores.items() ]
+        heapq.heapify(heap)
+    while heap and st.query_scores.get(heap[0][1]) != tuple(-v for v in heap[0][0]):
+        heapq.heappop(heap)
+    if not heap:
+        raise ValueError('no queries left')
+    return heap[0][1], st.query_scores[heap[0][1]]
+
+def get_score(st: SolverState, query: Query) -> Score:
+    cells = [ st.cells[c] for c in query ]
+    fmax = cells[0].max_factors & cells[1].max_factors
+    fmin = cells[0].min_factors & cells[1].min_factors
+    potential = st.count_greater(fmax, fmin)
+    guaranteed1 = st.count_greater(cells[1].min_factors & fmax, cells[0].min_factors)
+    guaranteed2 = st.count_greater(cells[0].min_factors & fmax, cells[1].min_factors)
+    return guaranteed1 + guaranteed2, potential, sum(1 for c in cells if c.is_target == None)
 
 def main():
     judge = RemoteJudge()
@@ -312,7 +494,7 @@ def main():
         result = judge.make_query(*query)
         assert result in state.indexes
         print(f'[{len(state.queries)}] Picked query {query}, received: {result} (score {score})')
-        state.queries[query] = result
+        state.add_query(query, result)
 
     answer = { c for c, cell in state.cells.items() if cell.is_target }
     print(f'Found answer in {len(state.queries)}:', answer)
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 
+import heapq
 from collections import Counter
+from typing import Iterable
 
 def main():
     for i in range(int(input())):
         N = int(input())
-        insns = [ tuple(input().split()) for _ in range(N) ]
-        assert all(len(insn) == 2 and insn[1] in ARGS for insn in insns)
-        min, diff = process_case(insns)
+        min, diff = process_case(read_insns(N))
         print(f'Case #{i+1}: {min}, {diff}')
 
+def read_insns(n: int):
+    for _ in range(n):
+        insn = tuple(input().split())
+        assert len(insn) == 2 and insn[1] in ARGS
+        yield insn
+
 ARGS = {
     'UP':    '00',
     'DOWN':  '11',
@@ -17,24 +23,40 @@ ARGS = {
     'LEFT':  '01',
 }
 
-def process_case(insns: list[tuple[int, int]]) -> tuple[int, int]:
-    codes = Counter(op for op, _ in insns)
+def process_case(insns: Iterable[tuple[str, str]]) -> tuple[int, int]:
+    # only the counts are needed, so the program is never kept in memory
+    codes, args_length = Counter(), 0
+    for op, arg in insns:
+        codes[op] += 1
+        args_length += len(ARGS[arg])
 
     # calculate huffman code
-    # nodes are (freq, max_depth, depths), we minimize freq then max_depth
-    nodes = [ (freq, 0, { label: 0 }) for label, freq in codes.items() ]
-    while len(nodes) > 1:
-        (fa, ma, da), (fb, mb, db), *nodes = sorted(nodes, key=lambda n: n[:2])
-        depths = { k: v + 1 for k, v in (da | db).items() }
-        nodes.append((fa + fb, max(ma, mb) + 1, depths))
-    _, max_depth, depths = nodes[0]
+    # nodes are (freq, max_depth, id), we minimize freq then max_depth, then
+    # take the oldest node (that's what a stable sort of the node list did)
+    labels = list(codes)
+    parent = [ -1 ] * len(labels)
+    heap = [ (freq, 0, id) for id, freq in enumerate(codes.values()) ]
+    heapq.heapify(heap)
+    while len(heap) > 1:
+        fa, ma, a = heapq.heappop(heap)
+        fb, mb, b = heapq.heappop(heap)
+        parent[a] = parent[b] = len(parent)
+        parent.append(-1)
+        heapq.heappush(heap, (fa + fb, max(ma, mb) + 1, parent[a]))
+    _, max_depth, _ = heap[0]
+
+    # parents are created after their children, so go backwards
+    depth = [ 0 ] * len(parent)
+    for id in reversed(range(len(parent) - 1)):
+        depth[id] = depth[parent[id]] + 1
+    depths = dict(zip(labels, depth))
 
     # override because apparently 0-length code for 1 node isn't allowed
     if len(depths) == 1:
         depths = { k: v + 1 for k, v in depths.items() }
         max_depth += 1
-    
-    length = sum(depths[op] + len(ARGS[arg]) for op, arg in insns)
+
+    length = sum(depths[op] * freq for op, freq in codes.items()) + args_length
     diff = max_depth - min(depths.values())
     return length, diff
 
@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
 
+import heapq
+import random
+from collections import deque
+from typing import Optional
+
 # you said 'an empty space', but there are many tests using two spaces as separator for the columns
 
 def main():
@@ -15,20 +20,258 @@ def main():
         ans = process_case(names, rows)
         print(f'Case #{i+1}: {ans}')
 
+MAX_NODES = 10**6  # removals tried before giving up
+
 def process_case(names: list[str], rows: list[list[str]]):
     board = ''.join(sum(rows, []))
-    # this is only challenge 2 so I'll just DFS in case there are dead ends.
-    # you don't expect me to do something more efficient, I hope
-    def remove_pokemon(names: tuple[str, ...], board: str):
-        if not names:
-            return board
-        for idx, name in enumerate(names):
-            for substr in (name, name[::-1]):
-                if (pos := board.find(substr)) != -1:
-                    new_names = names[:idx] + names[idx+1:]
-                    new_board = board[:pos] + board[pos+len(substr):]
-                    return remove_pokemon(new_names, new_board)
-        raise AssertionError('unsolvable map')
-    return remove_pokemon(tuple(names), board)
+    # we first try to remove the first name (in input order) that can be found,
+    # at its leftmost occurrence (forwards preferred). the names can't be
+    # looked up with board.find() every time on big boards, so all of them
+    # (and their reverses) are matched by one automaton, and the board is
+    # a linked list that only gets rescanned around every removal.
+    # if that leads to a dead end, we backtrack and try the next removal;
+    # states (remaining names + alive cells) already known to be dead are
+    # remembered so they're never explored again
+    patterns = list(dict.fromkeys( s for name in names for s in (name, name[::-1]) ))
+    pattern_ids = { s: k for k, s in enumerate(patterns) }
+    board = Board(board, Automaton(patterns))
+
+    remaining = list(range(len(names)))
+
+    def moves():
+        '''possible removals (position in remaining, occurrence) in order of preference'''
+        # remaining is the same whenever this resumes, since the removals
+        # made in between have been undone
+        seen = set()
+        for pos, idx in enumerate(remaining):
+            # removing either copy of a repeated name gives the same state
+            if (name := names[idx]) in seen: continue
+            seen.add(name)
+            for substr in dict.fromkeys((name, name[::-1])):
+                k = pattern_ids[substr]
+                if (first := board.find(k)) is None: continue
+                yield pos, first
+                # we only get here when backtracking
+                for occurrence in board.find_all(k):
+                    if occurrence != first:
+                        yield pos, occurrence
+
+    # every frame holds a state (remaining names as a bitmask, board hash),
+    # whether a removal led to it, and its pending moves
+    mask = (1 << len(names)) - 1
+    stack = [ (mask, board.hash, None, moves()) ]
+    dead: set[tuple[int, int]] = set()
+    nodes = 0
+    while stack:
+        mask, key, undo, pending = stack[-1]
+        if not remaining:
+            return str(board)
+        if (move := next(pending, None)) is None:
+            dead.add((mask, key))
+            stack.pop()
+            if undo is not None:
+                board.restore()
+                remaining.insert(*undo)
+            continue
+        if (nodes := nodes + 1) > MAX_NODES:
+            raise AssertionError('search limit exceeded')
+        pos, occurrence = move
+        idx = remaining.pop(pos)
+        board.remove(*occurrence)
+        child = mask & ~(1 << idx)
+        if (child, board.hash) in dead:
+            board.restore()
+            remaining.insert(pos, idx)
+            continue
+        stack.append((child, board.hash, (pos, idx), moves()))
+    raise AssertionError('unsolvable map')
+
+LETTERS = 26
+
+class Automaton(object):
+    '''Aho-Corasick automaton matching a list of patterns (of letters A-Z)'''
+    lengths: list[int]
+    max_length: int
+    delta: list[int]                # state * LETTERS + letter -> state
+    outputs: list[tuple[int, ...]]  # state -> patterns ending there
+
+    def __init__(self, patterns: list[str]):
+        self.lengths = list(map(len, patterns))
+        self.max_length = max(self.lengths, default=1)
+        goto: list[dict[int, int]] = [{}]
+        outputs: list[list[int]] = [[]]
+        for k, pattern in enumerate(patterns):
+            state = 0
+            for letter in pattern:
+                letter = ord(letter) - ord('A')
+                if letter not in goto[state]:
+                    goto[state][letter] = len(goto)
+                    goto.append({}); outputs.append([])
+                state = goto[state][letter]
+            outputs[state].append(k)
+
+        # BFS to compute failure links, and complete the transitions with them
+        delta = [0] * (len(goto) * LETTERS)
+        fail = [0] * len(goto)
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            if state:
+                outputs[state] += outputs[fail[state]]
+            for letter in range(LETTERS):
+                fallback = delta[fail[state] * LETTERS + letter] if state else 0
+                if (child := goto[state].get(letter)) is None:
+                    delta[state * LETTERS + letter] = fallback
+                else:
+                    delta[state * LETTERS + letter] = child
+                    fail[child] = fallback
+                    queue.append(child)
+        self.delta, self.outputs = delta, list(map(tuple, outputs))
+
+    def scan(self, letters: list[int]):
+        '''yield (end index, pattern) for every match in letters'''
+        delta, outputs, state = self.delta, self.outputs, 0
+        for idx, letter in enumerate(letters):
+            state = delta[state * LETTERS + letter]
+            for k in outputs[state]:
+                yield idx, k
+
+Occurrence = tuple[int, int]  # (first cell, last cell)
+Removal = tuple[int, int, list[tuple[int, Occurrence]], list[tuple[int, Occurrence]]]  # (first cell, last cell, occurrences pushed, popped since)
+
+class Board(object):
+    '''board supporting (undoable) removal of occurrences, which keeps track of all pattern occurrences'''
+    # cells are identified by their original index, so their order never changes
+    automaton: Automaton
+    letters: list[int]
+    next: list[int]
+    prev: list[int]
+    first: int
+    alive_tree: list[int]  # fenwick tree of alive cells, to count them in a range
+    occurrences: list[list[Occurrence]]  # heaps of (possibly stale) occurrences per pattern
+    removals: list[Removal]  # not undone yet
+    retired: set[tuple[int, Occurrence]]  # occurrences across the junction of an undone removal
+    cell_keys: list[int]
+    hash: int  # xor of the keys of alive cells
+
+    def __init__(self, board: str, automaton: Automaton):
+        n = len(board)
+        self.automaton = automaton
+        self.letters = [ ord(x) - ord('A') for x in board ]
+        self.next, self.prev = list(range(1, n + 1)), list(range(-1, n - 1))
+        self.first = 0
+        self.alive_tree = [0] * (n + 1)
+        for i in range(1, n + 1):
+            self.alive_tree[i] += 1
+            if (j := i + (i & -i)) <= n:
+                self.alive_tree[j] += self.alive_tree[i]
+        self.occurrences = [ [] for _ in automaton.lengths ]
+        for end, k in automaton.scan(self.letters):
+            self.occurrences[k].append((end - automaton.lengths[k] + 1, end))
+        for heap in self.occurrences:
+            heapq.heapify(heap)
+        self.removals = []
+        self.retired = set()
+        self.cell_keys = [ random.getrandbits(64) for _ in range(n) ]
+        self.hash = 0
+        for key in self.cell_keys:
+            self.hash ^= key
+
+    def __str__(self) -> str:
+        out, cell = [], self.first
+        while cell < len(self.letters):
+            out.append(chr(ord('A') + self.letters[cell]))
+            cell = self.next[cell]
+        return ''.join(out)
+
+    def count_alive(self, cell: int) -> int:
+        '''number of alive cells up to (including) cell'''
+        total, i = 0, cell + 1
+        while i > 0:
+            total += self.alive_tree[i]
+            i -= i & -i
+        return total
+
+    def set_alive(self, cell: int, delta: int):
+        self.hash ^= self.cell_keys[cell]
+        i = cell + 1
+        while i < len(self.alive_tree):
+            self.alive_tree[i] += delta
+            i += i & -i
+
+    def is_valid(self, k: int, occurrence: Occurrence) -> bool:
+        # none of its cells was removed: its ends are alive and contiguous
+        # (that's only enough if the removal it came from wasn't undone)
+        if (k, occurrence) in self.retired: return False
+        start, end = occurrence
+        return self.count_alive(start) - self.count_alive(start - 1) == 1 and \
+            self.count_alive(end) - self.count_alive(start) == self.automaton.lengths[k] - 1
+
+    def find(self, k: int) -> Optional[Occurrence]:
+        '''leftmost occurrence of pattern k, if any'''
+        heap = self.occurrences[k]
+        while heap and not self.is_valid(k, heap[0]):
+            # stale ones become valid again if a removal is undone, so remember them
+            x = heapq.heappop(heap)
+            if self.removals:
+                self.removals[-1][3].append((k, x))
+        return heap[0] if heap else None
+
+    def find_all(self, k: int) -> list[Occurrence]:
+        '''occurrences of pattern k, leftmost first'''
+        return sorted(set( x for x in self.occurrences[k] if self.is_valid(k, x) ))
+
+    def remove(self, start: int, end: int):
+        before, after = self.prev[start], self.next[end]
+        cell = start
+        while cell != after:
+            self.set_alive(cell, -1)
+            cell = self.next[cell]
+        if before >= 0:
+            self.next[before] = after
+        else:
+            self.first = after
+        if after < len(self.letters):
+            self.prev[after] = before
+
+        # look for new occurrences across the junction (once the removal is
+        # undone they're retired, and get dropped lazily)
+        reach = self.automaton.max_length - 1
+        left, cell = [], before
+        while cell >= 0 and len(left) < reach:
+            left.append(cell)
+            cell = self.prev[cell]
+        left.reverse()
+        right, cell = [], after
+        while cell < len(self.letters) and len(right) < reach:
+            right.append(cell)
+            cell = self.next[cell]
+        cells = left + right
+        pushed = []
+        for idx, k in self.automaton.scan([ self.letters[x] for x in cells ]):
+            if idx >= len(left) and (first := idx - self.automaton.lengths[k] + 1) < len(left):
+                heapq.heappush(self.occurrences[k], x := (cells[first], cells[idx]))
+                self.retired.discard((k, x))
+                pushed.append((k, x))
+        self.removals.append((start, end, pushed, []))
+
+    def restore(self):
+        '''undo the last removal'''
+        start, end, pushed, popped = self.removals.pop()
+        self.retired.update(pushed)
+        for k, x in popped:
+            heapq.heappush(self.occurrences[k], x)
+        # the removed cells still point to their old neighbours
+        before, after = self.prev[start], self.next[end]
+        if before >= 0:
+            self.next[before] = start
+        else:
+            self.first = start
+        if after < len(self.letters):
+            self.prev[after] = end
+        cell = start
+        while cell != after:
+            self.set_alive(cell, +1)
+            cell = self.next[cell]
 
 if __name__ == '__main__': main()
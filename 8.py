@@ -1,42 +1,214 @@
 #!/usr/bin/env python3
 
-from collections import defaultdict
+import sys
+from array import array
+import numpy as np
 
 def main():
+    # with --incremental, every case is a batch of edges added to the
+    # same graph, and we also print its bridges after every batch
+    forest = BlockForest() if '--incremental' in sys.argv[1:] else None
     for i in range(int(input())):
         T = int(input())
         edges = [ tuple(input().split(',')) for _ in range(T) ]
         assert all(len(edge) == 2 and all(edge) for edge in edges)
-        ans = process_case(edges)
-        print(f'Case #{i+1}: {",".join(sorted(ans)) if ans else "-"}')
+        if forest is None:
+            ans = process_case(edges)
+            print(f'Case #{i+1}: {",".join(sorted(ans)) if ans else "-"}')
+            continue
+        for x, y in edges:
+            forest.add_edge(x, y)
+        ans, bridges = forest.articulation_points(), forest.bridges()
+        bridges = ';'.join(sorted(f'{x},{y}' for x, y in map(sorted, bridges)))
+        print(f'Case #{i+1}: {",".join(sorted(ans)) if ans else "-"} | {bridges or "-"}')
+
+# graphs can be big: names are interned to integer ids, and the graph is
+# stored in CSR form (neighbors of node k are neighbors[offsets[k]:offsets[k+1]])
+
+CSRGraph = tuple[array, array]
+
+def build_csr(edges: list[tuple[str, str]]) -> tuple[list[str], CSRGraph]:
+    ids: dict[str, int] = {}
+    flat = array('q', ( ids.setdefault(x, len(ids)) for edge in edges for x in edge ))
+    names = list(ids)
+    pairs = np.frombuffer(flat, dtype=np.int64).reshape(-1, 2)
+    # sort both directions of every edge by (source, target), dropping repeated ones
+    keys = np.unique(np.concatenate([ pairs[:, 0] * len(names) + pairs[:, 1],
+        pairs[:, 1] * len(names) + pairs[:, 0] ]))
+    sources, targets = np.divmod(keys, max(len(names), 1))
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(names)), out=offsets[1:])
+    return names, (array('q', offsets.tobytes()), array('q', targets.tobytes()))
 
 def process_case(edges: list[tuple[str, str]]) -> set[str]:
-    neighbors: dict[str, set[str]] = defaultdict(set)
-    for x, y in edges:
-        neighbors[x].add(y)
-        neighbors[y].add(x)
-    if not neighbors:
+    names, (offsets, neighbors) = build_csr(edges)
+    if not names:
         return set()
 
-    heights: dict[str, int] = dict()
-    articulation_points: set[str] = set()
-
-    def dfs(node: str, height=0) -> int:
-        low = heights[node] = height
-        for neighbor in neighbors[node]:
-            if neighbor in heights:
-                sublow = heights[neighbor]  # back edge
-            else:
-                sublow = dfs(neighbor, height + 1)
-                if sublow >= height and height > 0:
-                    articulation_points.add(node)
-            low = min(low, sublow)
-        return low
-
-    dfs(root := next(iter(neighbors)))
-    assert len(heights) == len(neighbors), 'original graph not connected'
-    if sum(1 for n in neighbors[root] if heights[n] == 1) > 2:
+    # iterative DFS computing low-links; `pos` is the next neighbor to visit
+    heights = [-1] * len(names)
+    lows = [0] * len(names)
+    pos = offsets[:-1]
+    articulation_points: set[int] = set()
+
+    heights[root := 0] = 0
+    stack = [ root ]
+    while stack:
+        node = stack[-1]
+        if pos[node] < offsets[node + 1]:
+            neighbor = neighbors[pos[node]]
+            pos[node] += 1
+            if heights[neighbor] == -1:
+                heights[neighbor] = lows[neighbor] = heights[node] + 1
+                stack.append(neighbor)
+            elif heights[neighbor] < lows[node]:
+                lows[node] = heights[neighbor]  # back edge
+        else:
+            stack.pop()
+            if not stack: break
+            parent = stack[-1]
+            if lows[node] >= heights[parent] and heights[parent] > 0:
+                articulation_points.add(parent)
+            if lows[node] < lows[parent]:
+                lows[parent] = lows[node]
+
+    assert -1 not in heights, 'original graph not connected'
+    root_children = neighbors[offsets[root]:offsets[root + 1]]
+    if sum(1 for n in root_children if heights[n] == 1) > 2:
         articulation_points.add(root)
-    return articulation_points
+    return { names[k] for k in articulation_points }
+
+# INCREMENTAL MODE
+# ----------------
+
+# We keep a rooted block-cut forest: every block (biconnected component)
+# is a node whose parent is its topmost vertex, and every vertex (except
+# roots) has as parent the block containing the edge to its tree parent.
+# - an edge between two trees makes a new block of one edge (a bridge).
+#   the smaller tree is rerooted at its endpoint and hung from it.
+# - an edge inside a tree merges every block on the path between its
+#   endpoints into one, and the vertices between them stop joining blocks.
+# A vertex is an articulation point iff it's in 2 or more blocks, and an
+# edge is a bridge iff it's the only edge of its block. Blocks are merged
+# with union-find, so a batch costs about its size (amortized).
+
+class BlockForest(object):
+    names: list[str]
+    ids: dict[str, int]
+    edges: set[tuple[int, int]]
+    vparent: list[int]         # vertex -> block (or -1 if root)
+    nblocks: list[int]         # vertex -> number of blocks it's in
+    component: list[int]       # union-find of vertices, by connected component
+    component_size: list[int]
+    block_set: list[int]       # union-find of blocks
+    bparent: list[int]         # block -> topmost vertex (valid for set leaders)
+    bedges: list[int]          # block -> number of edges (valid for set leaders)
+    bfirst: list[tuple[int, int]]  # block -> its first edge
+    cut_vertices: set[int]
+    bridge_blocks: set[int]
+
+    def __init__(self):
+        self.names, self.ids, self.edges = [], {}, set()
+        self.vparent, self.nblocks, self.component, self.component_size = [], [], [], []
+        self.block_set, self.bparent, self.bedges, self.bfirst = [], [], [], []
+        self.cut_vertices, self.bridge_blocks = set(), set()
+
+    def articulation_points(self) -> set[str]:
+        return { self.names[v] for v in self.cut_vertices }
+
+    def bridges(self) -> set[tuple[str, str]]:
+        return { tuple(self.names[v] for v in self.bfirst[b]) for b in self.bridge_blocks }
+
+    def add_edge(self, x: str, y: str):
+        u, v = self.intern(x), self.intern(y)
+        if u == v or (min(u, v), max(u, v)) in self.edges:
+            return
+        self.edges.add((min(u, v), max(u, v)))
+        cu, cv = find(self.component, u), find(self.component, v)
+        if cu != cv:
+            if self.component_size[cu] < self.component_size[cv]:
+                u, v, cu, cv = v, u, cv, cu
+            self.reroot(v)
+            b = self.new_block(u, (u, v))
+            self.vparent[v] = b
+            self.add_blocks(u, 1); self.add_blocks(v, 1)
+            self.component[cv] = cu
+            self.component_size[cu] += self.component_size[cv]
+        else:
+            self.merge_path(u, v)
+
+    def intern(self, name: str) -> int:
+        if (v := self.ids.get(name)) is None:
+            v = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.vparent.append(-1); self.nblocks.append(0)
+            self.component.append(v); self.component_size.append(1)
+        return v
+
+    def new_block(self, top: int, edge: tuple[int, int]) -> int:
+        b = len(self.block_set)
+        self.block_set.append(b); self.bparent.append(top)
+        self.bedges.append(1); self.bfirst.append(edge)
+        self.bridge_blocks.add(b)
+        return b
+
+    def add_blocks(self, v: int, n: int):
+        self.nblocks[v] += n
+        (self.cut_vertices.add if self.nblocks[v] >= 2 else self.cut_vertices.discard)(v)
+
+    # nodes of the forest are encoded as 2*vertex or 2*block+1
+    def parent(self, node: int) -> int:
+        if node & 1:
+            return 2 * self.bparent[find(self.block_set, node >> 1)]
+        b = self.vparent[node >> 1]
+        return -1 if b == -1 else 2 * find(self.block_set, b) + 1
+
+    def set_parent(self, node: int, parent: int):
+        if node & 1:
+            self.bparent[find(self.block_set, node >> 1)] = parent >> 1
+        else:
+            self.vparent[node >> 1] = -1 if parent == -1 else parent >> 1
+
+    def reroot(self, v: int):
+        path = [ 2 * v ]
+        while (node := self.parent(path[-1])) != -1:
+            path.append(node)
+        for child, node in zip(path, path[1:]):
+            self.set_parent(node, child)
+        self.set_parent(2 * v, -1)
+
+    def merge_path(self, u: int, v: int):
+        # climb from both ends alternately until the paths meet
+        a, b = [ 2 * u ], [ 2 * v ]
+        seen_a, seen_b = { 2 * u }, { 2 * v }
+        while True:
+            if a[-1] in seen_b:
+                lca = a[-1]; break
+            if b[-1] in seen_a:
+                lca = b[-1]; break
+            for path, seen in ((a, seen_a), (b, seen_b)):
+                if (node := self.parent(path[-1])) != -1:
+                    path.append(node); seen.add(node)
+        path = a[:a.index(lca)] + [ lca ] + b[:b.index(lca)][::-1]
+
+        blocks = [ node >> 1 for node in path if node & 1 ]
+        top = self.parent(lca) >> 1 if lca & 1 else lca >> 1
+        for node in path[1:-1]:
+            if not node & 1:
+                self.add_blocks(node >> 1, -1)
+        merged = blocks[0]
+        total = sum(self.bedges[b] for b in blocks) + 1
+        for b in blocks:
+            self.bridge_blocks.discard(b)
+            self.block_set[b] = merged
+        self.bparent[merged], self.bedges[merged] = top, total
+
+def find(sets: list[int], x: int) -> int:
+    root = x
+    while sets[root] != root:
+        root = sets[root]
+    while sets[x] != root:
+        sets[x], x = root, sets[x]
+    return root
 
 if __name__ == '__main__': main()
@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
 
-# For this to go reasonably fast, we do two things:
+# For this to go reasonably fast, we do a few things:
 # - we store rows of bits in ints, using them as bitstrings
 #   so we can then use more efficient bitwise operations
 #   and so we can move a lot of the hot code into C land.
 # - since there's a lot of bitmap instances and they are sparse,
-#   checking every pair O(n^2) won't cut it; use a spatial index
+#   checking every pair O(n^2) won't cut it; sort the bounding boxes
+#   by X and sweep them, so we only check pairs whose boxes intersect
+# - the pixel check itself is still one Python loop per pair, so by
+#   default we pack every sprite into a matrix of uint64 words and test
+#   candidate pairs in batches with NumPy. pass --reference to use the
+#   int-row checker instead (to compare results), and --stats to
+#   print the number of candidate pairs found at every stage
+# - the same pair of sprites at the same relative offset shows up again
+#   and again (across defs and across cases), so results are memoized
+#   in a bounded LRU cache keyed by (sprite1, sprite2, dx, dy)
+# - sprites are sparse too, so we precompute their tight pixel bounding
+#   box and the span of set pixels of every row. pairs whose tight boxes
+#   don't intersect are rejected, and rows whose spans don't overlap are
+#   skipped, before looking at any actual pixels
 
-from typing import Callable
-from sklearn.neighbors import NearestNeighbors
+import sys
+from typing import Callable, Optional
+from collections import Counter, OrderedDict
+import numpy as np
 
 Point = tuple[int, int]
 point_add: Callable[[Point, Point], Point] = lambda x, y: (x[0] + y[0], x[1] + y[1])
@@ -21,35 +36,158 @@ point_max: Callable[[Point, Point], Point] = lambda x, y: (max(x[0], y[0]), max(
 # parsing / main code
 
 def main():
+    # sprites are big, so read the whole input at once and parse
+    # their pixels in bulk instead of line by line
+    reader = InputReader(sys.stdin.buffer.read())
+    input = reader.readline
     T = int(input())
     D = int(input())
-    sprites = [ parse_sprite() for _ in range(D) ]
-    process_case = process_sprites(sprites)
+    sprites = [ parse_sprite(reader) for _ in range(D) ]
+    backend = 'reference' if '--reference' in sys.argv[1:] else 'numpy'
+    stats = Counter()
+    process_case = process_sprites(sprites, backend, stats)
     for i in range(T):
         P = int(input())
-        defs = [ parse_sprite_def(sprites) for _ in range(P) ]
+        defs = [ parse_sprite_def(reader, sprites) for _ in range(P) ]
+        stats.clear()
         ans = process_case(defs)
         print(f'Case #{i+1}: {ans}')
+        if '--stats' in sys.argv[1:]:
+            print(f'Case #{i+1}: ' + ', '.join(f'{v} {k}' for k, v in stats.items()), file=sys.stderr)
 
 Sprite = tuple[Point, list[int]]
 SpriteDef = tuple[int, Point]
 
-def parse_sprite() -> Sprite:
-    W, H = map(int, input().split())
+class InputReader(object):
+    data: bytes
+    pos = 0
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def readline(self) -> str:
+        end = self.data.find(b'\n', self.pos)
+        end = len(self.data) if end == -1 else end
+        line, self.pos = self.data[self.pos:end], end + 1
+        return line.decode('ascii')
+
+    def read(self, size: int) -> bytes:
+        chunk, self.pos = self.data[self.pos:self.pos + size], self.pos + size
+        return chunk
+
+def parse_sprite(reader: InputReader) -> Sprite:
+    W, H = map(int, reader.readline().split())
     assert 0 <= W <= 512 and 0 <= H <= 512
-    rows = [ input() for _ in range(H) ]
-    assert all(len(row) == W and all(x in '01' for x in row) for row in rows)
-    rows = [ int(row[::-1], 2) for row in rows ]
+    # H rows of W digits, each followed by a newline
+    block = np.frombuffer(reader.read(H * (W + 1)), dtype=np.uint8)
+    assert len(block) == H * (W + 1)
+    block = block.reshape(H, W + 1)
+    assert (block[:, W] == ord('\n')).all()
+    assert ((block[:, :W] == ord('0')) | (block[:, :W] == ord('1'))).all()
+    # first pixel is the least significant bit
+    packed = np.packbits(block[:, :W] - ord('0'), axis=1, bitorder='little')
+    rows = [ int.from_bytes(row, 'little') for row in map(bytes, packed) ]
     return (W, H), rows
 
-def parse_sprite_def(sprites: list[Sprite]) -> SpriteDef:
-    I, X, Y = map(int, input().split())
+def parse_sprite_def(reader: InputReader, sprites: list[Sprite]) -> SpriteDef:
+    I, X, Y = map(int, reader.readline().split())
     assert 0 <= I < len(sprites)
     return I, (X, Y)
 
 # logic!
 
-def process_sprites(sprites: list[Sprite]) -> Callable[[SpriteDef], int]:
+WORD_BITS = 64
+MAX_WORDS = 512 // WORD_BITS
+ROW_BUDGET = 1 << 16  # rows to check per NumPy batch, bounds memory use
+ROW_STEP = 4  # rows checked per pair in the first round
+PAIR_BUDGET = 1 << 20  # sweep candidates to expand at once, bounds memory use
+CACHE_SIZE = 1 << 18  # memoized pair geometries
+
+class LRUCache(object):
+    maxsize: int
+    hits = 0
+    misses = 0
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key):
+        if (value := self.data.get(key)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+def find_box_pairs(start: np.ndarray, end: np.ndarray, stats: Counter) -> tuple[np.ndarray, np.ndarray]:
+    '''sort and sweep: find all (i, j) with i < j whose [start, end) boxes intersect'''
+    # after sorting by X start, the boxes overlapping box k in X are the
+    # ones that follow it and start before it ends
+    order = np.argsort(start[:, 0], kind='stable')
+    sx, sy, ex, ey = start[order, 0], start[order, 1], end[order, 0], end[order, 1]
+    last = np.searchsorted(sx, ex, 'left')
+    counts = np.maximum(last - np.arange(len(order)) - 1, 0)
+    cum_counts = np.cumsum(counts)
+
+    found1, found2 = [], []
+    k = 0
+    while k < len(order):
+        stop = max(np.searchsorted(cum_counts, cum_counts[k] - counts[k] + PAIR_BUDGET), k + 1)
+        ks = np.arange(k, stop)
+        c = counts[k:stop]
+        a = np.repeat(ks, c)
+        b = a + 1 + np.arange(len(a)) - np.repeat(np.cumsum(c) - c, c)
+        # the sweep ensures X overlap (except for empty boxes), check both axes
+        keep = (np.maximum(sy[a], sy[b]) < np.minimum(ey[a], ey[b])) & (sx[b] < ex[a])
+        stats['sweep candidates'] += len(a)
+        a, b = order[a[keep]], order[b[keep]]
+        found1.append(np.minimum(a, b)); found2.append(np.maximum(a, b))
+        k = stop
+    i1 = np.concatenate(found1) if found1 else np.zeros(0, dtype=np.int64)
+    i2 = np.concatenate(found2) if found2 else np.zeros(0, dtype=np.int64)
+    stats['box pairs'] += len(i1)
+    return i1, i2
+
+def pack_words(sprites: list[Sprite]) -> tuple[np.ndarray, np.ndarray]:
+    '''stack the rows of all sprites into a single uint64 word matrix'''
+    # the last column is always zero, so that shifted reads can overflow into it
+    rows = [ row for _, sprite in sprites for row in sprite ]
+    table = np.zeros((len(rows), MAX_WORDS + 1), dtype=np.uint64)
+    if rows:
+        buf = b''.join(row.to_bytes(MAX_WORDS * 8, 'little') for row in rows)
+        table[:, :MAX_WORDS] = np.frombuffer(buf, dtype='<u8').reshape(len(rows), MAX_WORDS)
+    heights = [ h for (_, h), _ in sprites ]
+    bases = np.cumsum([0] + heights[:-1], dtype=np.int64)
+    return table, bases
+
+def summarize_sprites(sprites: list[Sprite]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''compute the span of set pixels of every row, and the tight bounding box of every sprite'''
+    # spans are [lo, hi] column ranges, empty rows get an empty span
+    rows = [ row for _, sprite in sprites for row in sprite ]
+    row_lo = np.array([ (row & -row).bit_length() - 1 if row else 512 for row in rows ], dtype=np.int64)
+    row_hi = np.array([ row.bit_length() - 1 for row in rows ], dtype=np.int64)
+    tight_start = np.zeros((len(sprites), 2), dtype=np.int64)
+    tight_end = np.zeros((len(sprites), 2), dtype=np.int64)
+    base = 0
+    for idx, ((_, H), _) in enumerate(sprites):
+        lo, hi = row_lo[base:base + H], row_hi[base:base + H]
+        if (filled := np.flatnonzero(hi >= 0)).size:
+            tight_start[idx] = lo.min(), filled[0]
+            tight_end[idx] = hi.max() + 1, filled[-1] + 1
+        base += H
+    return row_lo, row_hi, tight_start, tight_end
+
+def process_sprites(sprites: list[Sprite], backend='numpy', stats: Optional[Counter]=None) -> Callable[[list[SpriteDef]], int]:
+    stats = Counter() if stats is None else stats
+    cache = LRUCache(CACHE_SIZE)
+
     def resolve_def(d: SpriteDef) -> tuple[Sprite, tuple[int, int], tuple[int, int]]:
         # returns (sprite pixel getter, bounding box start, bounding box end)
         idx, start = d
@@ -75,16 +213,123 @@ def process_sprites(sprites: list[Sprite]) -> Callable[[SpriteDef], int]:
             y1 += 1; y2 += 1
         return False
 
-    def process_case(defs: list[SpriteDef]) -> set[str]:
-        # build the spatial index, using the sprite centers
-        defsmap = NearestNeighbors(metric='chebyshev')
-        sprite_center = lambda d: point_add(d[1], point_scale(sprites[d[0]][0], 0.5))
-        defsmap.fit([ sprite_center(d) for d in defs ])
+    table, bases = pack_words(sprites)
+    row_lo, row_hi, tight_start, tight_end = summarize_sprites(sprites)
+    sizes = np.array([ size for size, _ in sprites ], dtype=np.int64).reshape(-1, 2)
+
+    def read_bits(rows: np.ndarray, shift: np.ndarray, nwords: int) -> np.ndarray:
+        # bits [shift, shift + 64*nwords) of each table row, as words
+        col = np.minimum((shift >> 6)[:, None] + np.arange(nwords + 1), MAX_WORDS)
+        words = table.ravel().take(col + (rows * (MAX_WORDS + 1))[:, None])
+        b = (shift & 63).astype(np.uint64)[:, None]
+        # shift in two steps, because shifting by 64 is undefined
+        return (words[:, :-1] >> b) | ((words[:, 1:] << np.uint64(1)) << (np.uint64(63) - b))
+
+    def check_rows(rows1, rows2, shift, nrows, nwords) -> tuple[np.ndarray, np.ndarray]:
+        # expand every pair into `nrows` rows, then AND them all at once.
+        # only the second sprite of a pair needs shifting (see below).
+        # returns whether each pair collided, and whether any row spans overlapped
+        starts = np.cumsum(nrows) - nrows
+        pair = np.repeat(np.arange(len(nrows)), nrows)
+        dy = np.arange(len(pair)) - starts[pair]
+        rows1, rows2, shift = rows1[pair] + dy, rows2[pair] + dy, shift[pair]
+        # skip rows whose spans don't overlap (in sprite 1 coordinates)
+        spans = np.maximum(row_lo[rows1], row_lo[rows2] - shift) <= \
+            np.minimum(row_hi[rows1], row_hi[rows2] - shift)
+        todo = np.flatnonzero(spans)
+        row1 = table[rows1[todo], :nwords]
+        row2 = read_bits(rows2[todo], shift[todo], nwords)
+        hits = np.zeros(len(pair), dtype=bool)
+        hits[todo] = (row1 & row2).any(axis=1)
+        return np.logical_or.reduceat(hits, starts), np.logical_or.reduceat(spans, starts)
+
+    def sprites_collide_many(defs1: np.ndarray, defs2: np.ndarray) -> np.ndarray:
+        # defs are (idx, x, y) rows; returns one bool per pair
+        # swap pairs so that the first sprite is the rightmost one, then
+        # it starts at the intersection and doesn't need shifting
+        swap = defs1[:, 1] < defs2[:, 1]
+        defs1, defs2 = np.where(swap[:, None], defs2, defs1), np.where(swap[:, None], defs1, defs2)
+        idx1, p1 = defs1[:, 0], defs1[:, 1:]
+        idx2, p2 = defs2[:, 0], defs2[:, 1:]
+        p = np.maximum(p1, p2)
+        iw = np.minimum(p1[:, 0] + sizes[idx1, 0], p2[:, 0] + sizes[idx2, 0]) - p[:, 0]
+        shift = p[:, 0] - p2[:, 0]
+        # no mask needed: one of the sprites ends at the intersection's
+        # right edge, so it has no bits past it
+        nwords = -(-iw // WORD_BITS)
+
+        # intersect the tight boxes instead; this rejects pairs that only
+        # overlap in empty space, and only leaves the rows worth checking
+        tp = np.maximum(p1 + tight_start[idx1], p2 + tight_start[idx2])
+        tq = np.minimum(p1 + tight_end[idx1], p2 + tight_end[idx2])
+        ih = tq[:, 1] - tp[:, 1]
+        rows1 = bases[idx1] + tp[:, 1] - p1[:, 1]
+        rows2 = bases[idx2] + tp[:, 1] - p2[:, 1]
+        alive = np.flatnonzero((tq > tp).all(axis=1) & (iw > 0))
+        stats['rejected by tight box'] += len(defs1) - len(alive)
+        checked = alive
+
+        # check a few rows of every pair, drop the ones that collided,
+        # repeat with more rows. most colliding pairs exit early this way
+        result = np.zeros(len(defs1), dtype=bool)
+        spans = np.zeros(len(defs1), dtype=bool)
+        y, step = 0, ROW_STEP
+        while len(alive):
+            nrows = np.minimum(ih[alive] - y, step)
+            cum_nrows = np.cumsum(nrows)
+            hit = np.zeros(len(alive), dtype=bool)
+            start = 0
+            while start < len(alive):
+                end = max(np.searchsorted(cum_nrows, cum_nrows[start] - nrows[start] + ROW_BUDGET), start + 1)
+                sel = alive[start:end]
+                hit[start:end], sel_spans = check_rows(rows1[sel] + y, rows2[sel] + y, shift[sel],
+                    nrows[start:end], int(nwords[sel].max()))
+                spans[sel] |= sel_spans
+                start = end
+            result[alive[hit]] = True
+            alive = alive[~hit & (ih[alive] > y + step)]
+            y, step = y + step, step * 2
+        stats['rejected by row spans'] += int((~spans[checked]).sum())
+        stats['rejected by pixels'] += int((spans[checked] & ~result[checked]).sum())
+        return result
+
+    def collide_geometries(geoms: np.ndarray) -> np.ndarray:
+        # geoms are (idx1, idx2, dx, dy) rows, sprite 1 being at the origin
+        defs1 = np.zeros((len(geoms), 3), dtype=np.int64)
+        defs1[:, 0] = geoms[:, 0]
+        defs2 = geoms[:, 1:]
+        if backend == 'reference':
+            return np.array([ sprites_collide((a, (0, 0)), (b, (dx, dy)))
+                for a, b, dx, dy in geoms.tolist() ], dtype=bool)
+        return sprites_collide_many(defs1, defs2)
+
+    def process_case(defs: list[SpriteDef]) -> int:
+        # find pairs of sprites whose bounding boxes intersect
+        defs_arr = np.array([ (idx, x, y) for idx, (x, y) in defs ], dtype=np.int64).reshape(-1, 3)
+        start = defs_arr[:, 1:]
+        i1, i2 = find_box_pairs(start, start + sizes[defs_arr[:, 0]], stats)
+
+        # only the relative geometry matters, normalize it so that
+        # (a, b, dx, dy) and (b, a, -dx, -dy) are the same key
+        d1, d2 = defs_arr[i1], defs_arr[i2]
+        geoms = np.concatenate([ d1[:, :1], d2[:, :1], d2[:, 1:] - d1[:, 1:] ], axis=1)
+        swapped = np.concatenate([ geoms[:, 1::-1], -geoms[:, 2:] ], axis=1)
+        swap = (geoms[:, 0] > geoms[:, 1]) | ((geoms[:, 0] == geoms[:, 1]) &
+            ((geoms[:, 2] < 0) | ((geoms[:, 2] == 0) & (geoms[:, 3] < 0))))
+        geoms = np.where(swap[:, None], swapped, geoms)
+        geoms, inverse = np.unique(geoms, axis=0, return_inverse=True)
 
-        # perform search
-        hits = defsmap.radius_neighbors(radius=512, return_distance=False)
-        return sum(1 for i1, shits in enumerate(hits) for i2 in shits
-            if i2 > i1 and sprites_collide(defs[i1], defs[i2]))
+        # look up the cache, check pixels of the rest
+        keys = list(map(tuple, geoms.tolist()))
+        hits, misses = cache.hits, cache.misses
+        results = [ cache.get(key) for key in keys ]
+        todo = [ n for n, result in enumerate(results) if result is None ]
+        stats['cache hits'] += cache.hits - hits
+        stats['cache misses'] += cache.misses - misses
+        for n, result in zip(todo, collide_geometries(geoms[todo]).tolist()):
+            results[n] = result
+            cache.put(keys[n], result)
+        return int(np.array(results, dtype=bool)[inverse.ravel()].sum())
 
     return process_case
 
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+'''
+Usage: run_archive.py <script> <archive> [<member>...]
+
+Runs N.py with a member of a .tar.gz archive (or a plain .gz file) as its
+input, streaming it instead of extracting it to disk first. If no members
+are given, the script is run once for every file in the archive.
+'''
+
+import os
+import sys
+import gzip
+import shutil
+import tarfile
+import subprocess
+from typing import BinaryIO
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__.strip(), file=sys.stderr)
+        exit(1)
+    scrname, archive, *members = sys.argv[1:]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{scrname}.py')
+
+    if not tarfile.is_tarfile(archive):
+        with gzip.open(archive) as f:
+            exit(run_script(script, f))
+
+    # streaming mode: members are read in order, without seeking back
+    status, found = 0, set()
+    with tarfile.open(archive, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile() or (members and member.name not in members):
+                continue
+            if len(members) != 1:
+                print(f'==> {member.name} <==', file=sys.stderr)
+            status = run_script(script, tar.extractfile(member)) or status
+            found.add(member.name)
+    for name in members:
+        if name not in found:
+            print(f'{archive}: no member named {name}', file=sys.stderr)
+            status = 1
+    exit(status)
+
+def run_script(script: str, input: BinaryIO) -> int:
+    '''run script with input as its stdin, return its exit status'''
+    proc = subprocess.Popen([script], stdin=subprocess.PIPE)
+    try:
+        shutil.copyfileobj(input, proc.stdin)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass  # the script exited early, its status will tell
+    return proc.wait()
+
+if __name__ == '__main__': main()
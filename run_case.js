@@ -8,25 +8,35 @@ const CSI = '\u001b['
 const SGR = (x = '') => `${CSI}${x}m`
 
 const args = process.argv.slice(2)
-if (args.length !== 2) {
-    console.error('Usage: <script> <case name>')
+if (args.length !== 2 && args.length !== 3) {
+    console.error('Usage: <script> <case name> [<archive>[:<member>]]')
     process.exit(1)
 }
-const [scrname, casename] = args
+const [scrname, casename, archive] = args
 
 const scrFn = `${__dirname}/${scrname}.py`
 const inFn = `${__dirname}/case/${scrname}.${casename}.in.txt`
 const outFn = `${__dirname}/case/${scrname}.${casename}.out.txt`
 const refFn = `${__dirname}/case/${scrname}.${casename}.ref.txt`
 
-const inFd = fs.openSync(inFn)
 const refFile = fs.createReadStream(refFn)
 const outFile = fs.createWriteStream(outFn)
 
-const proc = child_process.spawn(scrFn, [], {
-    stdio: [inFd, 'pipe', 'inherit'],
-})
-fs.closeSync(inFd)
+let proc
+if (archive) {
+    // input is streamed out of the archive (relative to case/) by run_archive.py
+    const [arName, member] = archive.split(/:(.*)/s)
+    proc = child_process.spawn(`${__dirname}/run_archive.py`,
+        [scrname, `${__dirname}/case/${arName}`, ...(member ? [member] : [])], {
+        stdio: ['ignore', 'pipe', 'inherit'],
+    })
+} else {
+    const inFd = fs.openSync(inFn)
+    proc = child_process.spawn(scrFn, [], {
+        stdio: [inFd, 'pipe', 'inherit'],
+    })
+    fs.closeSync(inFd)
+}
 
 proc.stdout.pipe(outFile)
 